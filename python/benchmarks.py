@@ -0,0 +1,423 @@
+"""
+Throughput, latency and memory benchmarks for ConstructionWriter and ConstructionReader.
+
+Constructions are generated from a fixed seed so results from different commits can be compared.
+Run from the repository root:
+
+    python -m python.benchmarks --output before.json
+    python -m python.benchmarks --output after.json --compare before.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import List, Tuple, Dict, Any, Optional, Callable
+
+import numpy
+import amulet_nbt
+from amulet.api.block import Block
+from amulet.api.entity import Entity
+
+from python.construction import (
+    ConstructionReader,
+    ConstructionWriter,
+    ConstructionSection,
+    Instrumentation,
+    max_format_version,
+    max_section_version,
+)
+
+# sections is the section count, entities is the number of entities per section
+# and empty_ratio and uniform_ratio are the fraction of sections with no block data and with one block
+SCENARIOS: List[Dict[str, Any]] = [
+    dict(
+        name="baseline",
+        sections=512,
+        palette_size=16,
+        entities=0,
+        empty_ratio=0.0,
+        uniform_ratio=0.0,
+    ),
+    dict(
+        name="large_palette",
+        sections=512,
+        palette_size=1024,
+        entities=0,
+        empty_ratio=0.0,
+        uniform_ratio=0.0,
+    ),
+    dict(
+        name="entity_heavy",
+        sections=512,
+        palette_size=16,
+        entities=8,
+        empty_ratio=0.0,
+        uniform_ratio=0.0,
+    ),
+    dict(
+        name="sparse",
+        sections=512,
+        palette_size=16,
+        entities=1,
+        empty_ratio=0.5,
+        uniform_ratio=0.0,
+    ),
+    dict(
+        name="terrain",
+        sections=512,
+        palette_size=64,
+        entities=0,
+        empty_ratio=0.1,
+        uniform_ratio=0.6,
+    ),
+    dict(
+        name="many_sections",
+        sections=8192,
+        palette_size=64,
+        entities=0,
+        empty_ratio=0.0,
+        uniform_ratio=0.3,
+    ),
+]
+
+# metrics where a larger value is better. Used by the comparison
+HIGHER_IS_BETTER = {"sections_per_second", "megabytes_per_second"}
+
+
+def generate_sections(
+    scenario: Dict[str, Any], seed: int
+) -> Tuple[List[Block], List[ConstructionSection]]:
+    """
+    Generate the palette and sections of a scenario.
+    Empty sections have no block data. Uniform sections are one block throughout.
+    Other sections are made of 4x4x4 cells of random blocks.
+    """
+    rng = numpy.random.default_rng(seed)
+    palette = [Block("minecraft", "air")] + [
+        Block("benchmark", f"block_{i}", {"variant": amulet_nbt.TAG_String(str(i % 4))})
+        for i in range(scenario["palette_size"] - 1)
+    ]
+    section_count = scenario["sections"]
+    side = int(numpy.ceil(section_count ** (1 / 3)))
+    kinds = rng.random(section_count)
+    sections = []
+    for i in range(section_count):
+        min_pos = tuple(int(c) * 16 for c in numpy.unravel_index(i, (side, side, side)))
+        if kinds[i] < scenario["empty_ratio"]:
+            blocks = None
+        elif kinds[i] < scenario["empty_ratio"] + scenario["uniform_ratio"]:
+            blocks = numpy.full((16, 16, 16), rng.integers(len(palette)))
+        else:
+            cells = rng.integers(0, len(palette), (4, 4, 4))
+            blocks = cells.repeat(4, 0).repeat(4, 1).repeat(4, 2)
+        entities = [
+            Entity(
+                "minecraft",
+                "armor_stand",
+                *(numpy.array(min_pos) + rng.random(3) * 16).tolist(),
+                amulet_nbt.NBTFile(
+                    amulet_nbt.TAG_Compound(
+                        {"CustomName": amulet_nbt.TAG_String(f"entity_{i}_{j}")}
+                    )
+                ),
+            )
+            for j in range(scenario["entities"])
+        ]
+        sections.append(
+            ConstructionSection(
+                min_pos,
+                (16, 16, 16),
+                blocks,
+                palette,
+                entities,
+                None if blocks is None else [],
+            )
+        )
+    return palette, sections
+
+
+def latency_stats(latencies: List[float]) -> Dict[str, float]:
+    """Summarise latencies in seconds as milliseconds."""
+    if not latencies:
+        return {}
+    array = numpy.array(latencies) * 1000
+    return {
+        "mean_ms": float(array.mean()),
+        "p50_ms": float(numpy.percentile(array, 50)),
+        "p90_ms": float(numpy.percentile(array, 90)),
+        "p99_ms": float(numpy.percentile(array, 99)),
+        "max_ms": float(array.max()),
+    }
+
+
+def peak_memory(func: Callable[[], Any]) -> int:
+    """The peak number of bytes allocated by Python while running func."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def write_construction(
+    path: str,
+    sections: List[ConstructionSection],
+    writer_kwargs: Dict[str, Any],
+    instrumentation: Optional[Instrumentation] = None,
+) -> Tuple[List[float], float]:
+    """Write the sections and return the latency of each write call and of close."""
+    latencies = []
+    writer = ConstructionWriter(
+        path, "java", (1, 16, 5), instrumentation=instrumentation, **writer_kwargs
+    )
+    for section in sections:
+        start = time.perf_counter()
+        writer.write(section)
+        latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    writer.close()
+    return latencies, time.perf_counter() - start
+
+
+def read_construction(
+    path: str, instrumentation: Optional[Instrumentation] = None
+) -> Tuple[float, List[float]]:
+    """Read every section and return the latency of opening the file and of each read call."""
+    start = time.perf_counter()
+    reader = ConstructionReader(path, instrumentation=instrumentation)
+    open_time = time.perf_counter() - start
+    latencies = []
+    try:
+        for section_index in range(len(reader.sections)):
+            start = time.perf_counter()
+            reader.read(section_index)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        reader.close()
+    return open_time, latencies
+
+
+def run_scenario(
+    scenario: Dict[str, Any],
+    directory: str,
+    repeat: int,
+    seed: int,
+    writer_kwargs: Dict[str, Any],
+) -> Dict[str, Any]:
+    _, sections = generate_sections(scenario, seed)
+    path = os.path.join(directory, f"{scenario['name']}.construction")
+
+    write_latencies = []
+    close_times = []
+    write_totals = []
+    open_times = []
+    read_latencies = []
+    read_totals = []
+    for _ in range(repeat):
+        latencies, close_time = write_construction(path, sections, writer_kwargs)
+        write_latencies += latencies
+        close_times.append(close_time)
+        write_totals.append(sum(latencies) + close_time)
+
+        open_time, latencies = read_construction(path)
+        open_times.append(open_time)
+        read_latencies += latencies
+        read_totals.append(open_time + sum(latencies))
+
+    file_size = os.path.getsize(path)
+    # memory is measured separately because tracing allocations slows everything down
+    write_memory = peak_memory(
+        lambda: write_construction(path, sections, writer_kwargs)
+    )
+    read_memory = peak_memory(lambda: read_construction(path))
+    # and the phase breakdown because the instrumentation adds a small overhead
+    write_instrumentation = Instrumentation()
+    write_construction(path, sections, writer_kwargs, write_instrumentation)
+    read_instrumentation = Instrumentation()
+    read_construction(path, read_instrumentation)
+
+    write_total = float(numpy.median(write_totals))
+    read_total = float(numpy.median(read_totals))
+    return {
+        "scenario": scenario,
+        "file_size": file_size,
+        "write": {
+            "total_s": write_total,
+            "sections_per_second": len(sections) / write_total,
+            "megabytes_per_second": file_size / write_total / 1e6,
+            "write_latency": latency_stats(write_latencies),
+            "close_s": float(numpy.median(close_times)),
+            "peak_memory_bytes": write_memory,
+            **write_instrumentation.stats,
+        },
+        "read": {
+            "total_s": read_total,
+            "sections_per_second": len(sections) / read_total,
+            "megabytes_per_second": file_size / read_total / 1e6,
+            "open_s": float(numpy.median(open_times)),
+            "read_latency": latency_stats(read_latencies),
+            "peak_memory_bytes": read_memory,
+            **read_instrumentation.stats,
+        },
+    }
+
+
+def environment() -> Dict[str, Any]:
+    """Identify the commit and machine the benchmarks were run on."""
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=repo,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                cwd=repo,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+        dirty = None
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version,
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "max_format_version": max_format_version,
+        "max_section_version": max_section_version,
+    }
+
+
+def _flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """Describe the change in each metric of the scenarios present in both results."""
+    old_results = {r["scenario"]["name"]: r for r in old["results"]}
+    lines = [
+        f"{old['environment']['commit']} -> {new['environment']['commit']}",
+    ]
+    for result in new["results"]:
+        name = result["scenario"]["name"]
+        if name not in old_results:
+            continue
+        old_metrics = _flatten(
+            {k: v for k, v in old_results[name].items() if k != "scenario"}
+        )
+        new_metrics = _flatten({k: v for k, v in result.items() if k != "scenario"})
+        for metric, value in new_metrics.items():
+            old_value = old_metrics.get(metric)
+            if not old_value:
+                continue
+            ratio = value / old_value
+            better = (
+                ratio > 1
+                if metric.rsplit(".", 1)[-1] in HIGHER_IS_BETTER
+                else ratio < 1
+            )
+            lines.append(
+                f"{name:16} {metric:40} {old_value:14.4f} {value:14.4f} {ratio:7.3f}x {'better' if better else 'worse' if ratio != 1 else ''}"
+            )
+    return lines
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--output", help="The path to write the JSON results to. Defaults to stdout."
+    )
+    parser.add_argument(
+        "--compare", help="The path of earlier JSON results to compare against."
+    )
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        help="Only run the named scenario. May be given more than once.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="The number of times to run each scenario.",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="The seed of the generated constructions."
+    )
+    parser.add_argument(
+        "--quick",
+        action="store_true",
+        help="Divide the section counts by 16 for a quick check.",
+    )
+    parser.add_argument(
+        "--writer-kwargs",
+        default="{}",
+        help="JSON object of extra ConstructionWriter arguments.",
+    )
+    args = parser.parse_args(args)
+
+    writer_kwargs = json.loads(args.writer_kwargs)
+    scenarios = [
+        s for s in SCENARIOS if args.scenario is None or s["name"] in args.scenario
+    ]
+    if args.quick:
+        scenarios = [{**s, "sections": max(1, s["sections"] // 16)} for s in scenarios]
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = {
+            "environment": environment(),
+            "settings": {
+                "repeat": args.repeat,
+                "seed": args.seed,
+                "quick": args.quick,
+                "writer_kwargs": writer_kwargs,
+            },
+            "results": [
+                run_scenario(scenario, directory, args.repeat, args.seed, writer_kwargs)
+                for scenario in scenarios
+            ],
+        }
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        print("\n".join(compare(old, results)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,32 @@
 from __future__ import annotations
 
 import os
+import mmap
 import struct
-from typing import Type, Union, Tuple, IO, List, Optional
+import zlib
+import gzip
+import hashlib
+import threading
+import time
+import asyncio
+import functools
+import collections
+import concurrent.futures
+from typing import (
+    Type,
+    Union,
+    Tuple,
+    IO,
+    List,
+    Optional,
+    Iterable,
+    Iterator,
+    Deque,
+    Dict,
+    Callable,
+    Any,
+    AsyncIterator,
+)
 
 from amulet import Block
 from amulet.api.registry import BlockManager
@@ -13,6 +37,16 @@ import amulet_nbt
 
 import numpy
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
 INT_TRIPLET = Tuple[int, int, int]
 
 INT_STRUCT = struct.Struct(">I")
@@ -28,12 +62,306 @@ SECTION_ENTRY_TYPE = numpy.dtype(
         ("length", "i4"),
     ]
 )
+SUB_CHUNK_KEY_TYPE = numpy.dtype([("cx", "i4"), ("cy", "i4"), ("cz", "i4")])
+# from format version 2 the section index and sub-chunk tables are stored uncompressed after the metadata
+SECTION_ENTRY_TYPE_BE = SECTION_ENTRY_TYPE.newbyteorder(">")
+SUB_CHUNK_KEY_TYPE_BE = SUB_CHUNK_KEY_TYPE.newbyteorder(">")
+SUB_CHUNK_ORDER_TYPE_BE = numpy.dtype(">i4")
+# section version, section compression, metadata start, metadata length,
+# palette start, palette length, section index table start, section count
+FOOTER_STRUCT = struct.Struct(">BBIIIIII")
 
 magic_num = b"constrct"
 magic_num_len = len(magic_num)
 
-max_format_version = 0
-max_section_version = 0
+gzip_magic_num = b"\x1f\x8b"
+
+max_format_version = 2
+max_section_version = 2
+
+# the blocks_array_type of bit packed block arrays. Used from section version 1
+BIT_PACKED_ARRAY_TYPE = -2
+# the blocks_array_type of sections made of a single block. Used from section version 2
+UNIFORM_ARRAY_TYPE = -3
+
+
+def _pack_bits(array: numpy.ndarray, bit_width: int) -> numpy.ndarray:
+    """Pack the non-negative integers in a flat array into bit_width bits each, most significant bit first."""
+    shifts = numpy.arange(bit_width - 1, -1, -1, dtype=numpy.uint64)
+    bits = (array.astype(numpy.uint64)[:, numpy.newaxis] >> shifts) & 1
+    return numpy.packbits(bits.astype(numpy.uint8).ravel())
+
+
+def _unpack_bits(packed: numpy.ndarray, bit_width: int, count: int) -> numpy.ndarray:
+    """Unpack count integers of bit_width bits each packed by _pack_bits."""
+    bits = numpy.unpackbits(packed.view(numpy.uint8), count=count * bit_width).reshape(
+        count, bit_width
+    )
+    weights = numpy.left_shift(
+        1, numpy.arange(bit_width - 1, -1, -1, dtype=numpy.int64)
+    )
+    return bits @ weights
+
+
+# the compression id of each supported codec. Stored in the file from format version 1
+COMPRESSION_NONE = 0
+COMPRESSION_GZIP = 1
+COMPRESSION_ZLIB = 2
+COMPRESSION_ZSTD = 3
+COMPRESSION_LZ4 = 4
+compression_ids = {
+    "none": COMPRESSION_NONE,
+    "gzip": COMPRESSION_GZIP,
+    "zlib": COMPRESSION_ZLIB,
+    "zstd": COMPRESSION_ZSTD,
+    "lz4": COMPRESSION_LZ4,
+}
+
+
+def _gunzip(data: Union[bytes, memoryview]) -> bytes:
+    """Decompress a gzip'd payload. Payloads that are not gzip'd are returned as is."""
+    if data[:2] == gzip_magic_num:
+        # wbits of 16 + MAX_WBITS expects a gzip header and trailer
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+    return bytes(data)
+
+
+def _compress(data: bytes, compression: int, level: Optional[int] = None) -> bytes:
+    """Compress data with the codec with the given compression id."""
+    if compression == COMPRESSION_NONE:
+        return data
+    elif compression == COMPRESSION_GZIP:
+        # a fixed mtime means the same data always compresses to the same bytes
+        return gzip.compress(data, 9 if level is None else level, mtime=0)
+    elif compression == COMPRESSION_ZLIB:
+        return zlib.compress(data, -1 if level is None else level)
+    elif compression == COMPRESSION_ZSTD:
+        assert zstandard is not None, "zstandard must be installed to use zstd"
+        return zstandard.ZstdCompressor(3 if level is None else level).compress(data)
+    elif compression == COMPRESSION_LZ4:
+        assert lz4 is not None, "lz4 must be installed to use lz4"
+        return lz4.frame.compress(data, 0 if level is None else level)
+    raise Exception(f"Unknown compression id {compression}")
+
+
+def _decompress(data: Union[bytes, memoryview], compression: int) -> bytes:
+    """Decompress data compressed with the codec with the given compression id."""
+    if compression == COMPRESSION_NONE:
+        return bytes(data)
+    elif compression == COMPRESSION_GZIP:
+        return _gunzip(data)
+    elif compression == COMPRESSION_ZLIB:
+        return zlib.decompress(data)
+    elif compression == COMPRESSION_ZSTD:
+        assert zstandard is not None, "zstandard must be installed to read zstd"
+        return zstandard.ZstdDecompressor().decompress(data)
+    elif compression == COMPRESSION_LZ4:
+        assert lz4 is not None, "lz4 must be installed to read lz4"
+        return lz4.frame.decompress(data)
+    raise Exception(f"Unknown compression id {compression}")
+
+
+class LRUCache:
+    """A thread safe least recently used cache bounded by the total size of its values."""
+
+    def __init__(self, max_size: int, size_of: Callable[[Any], int] = None):
+        """
+        :param max_size: The maximum total size of the values in the cache.
+        :param size_of: A function to get the size of a value. Defaults to each value having a size of 1.
+        """
+        self._max_size = max_size
+        self._size_of = size_of or (lambda value: 1)
+        self._data: collections.OrderedDict[
+            Any, Tuple[Any, int]
+        ] = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, max_size: int):
+        with self._lock:
+            self._max_size = max_size
+            self._evict()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key) -> bool:
+        return key in self._data
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._data),
+            "size": self._size,
+            "max_size": self._max_size,
+        }
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self._size_of(value)
+        with self._lock:
+            if key in self._data:
+                self._size -= self._data.pop(key)[1]
+            if size > self._max_size:
+                return
+            self._data[key] = (value, size)
+            self._size += size
+            self._evict()
+
+    def _evict(self):
+        while self._size > self._max_size:
+            _, (_, size) = self._data.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+
+# decoded palette entries shared between all readers keyed by the raw entry content
+palette_cache = LRUCache(4096)
+
+
+class _Phase:
+    """Times one run of a phase. Set bytes before exiting to record the amount of data processed."""
+
+    __slots__ = ("_instrumentation", "_name", "_start", "bytes")
+
+    def __init__(self, instrumentation: Instrumentation, name: str, nbytes: int):
+        self._instrumentation = instrumentation
+        self._name = name
+        self._start = 0.0
+        self.bytes = nbytes
+
+    def __enter__(self) -> _Phase:
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._instrumentation.record(
+            self._name, time.perf_counter() - self._start, self.bytes
+        )
+
+
+class Instrumentation:
+    """
+    Accumulates the time and bytes spent in each phase of reading and writing and counts of the data processed.
+    May be shared between readers, writers and threads. Work done in a process pool is counted but not timed.
+
+    Phases: io, decompress, compress, nbt_parse, nbt_serialise, palette_unpack, palette_pack, remap,
+    blocks (block array packing and unpacking) and entities (entity and block entity conversion).
+    The bytes of each phase are the size of the data it consumed.
+
+    Counters: sections, blocks, entities and block_entities.
+    """
+
+    def __init__(self, callback: Optional[Callable[[str, float, int], None]] = None):
+        """
+        :param callback: If defined, called with the phase name, seconds and bytes at the end of each phase.
+        """
+        self._callback = callback
+        self._lock = threading.Lock()
+        # phase name -> [calls, seconds, bytes]
+        self._phases: Dict[str, List[Union[int, float]]] = {}
+        self._counters: Dict[str, int] = collections.Counter()
+
+    def phase(self, name: str, nbytes: int = 0) -> _Phase:
+        """A context manager that times a phase."""
+        return _Phase(self, name, nbytes)
+
+    def record(self, name: str, seconds: float, nbytes: int = 0):
+        """Add one run of a phase."""
+        with self._lock:
+            totals = self._phases.setdefault(name, [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += nbytes
+        if self._callback is not None:
+            self._callback(name, seconds, nbytes)
+
+    def count(self, name: str, n: int = 1):
+        """Increment a counter."""
+        with self._lock:
+            self._counters[name] += n
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """The calls, seconds and bytes of each phase and the value of each counter."""
+        with self._lock:
+            return {
+                "phases": {
+                    name: {"calls": calls, "seconds": seconds, "bytes": nbytes}
+                    for name, (calls, seconds, nbytes) in self._phases.items()
+                },
+                "counters": dict(self._counters),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._phases.clear()
+            self._counters.clear()
+
+
+class _NullPhase:
+    __slots__ = ("bytes",)
+
+    def __enter__(self) -> _NullPhase:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class _NullInstrumentation(Instrumentation):
+    """Records nothing. Used when no instrumentation is given. Can be sent to a process pool."""
+
+    def __init__(self):
+        self._phase = _NullPhase()
+
+    def phase(self, name: str, nbytes: int = 0) -> _NullPhase:
+        return self._phase
+
+    def record(self, name: str, seconds: float, nbytes: int = 0):
+        pass
+
+    def count(self, name: str, n: int = 1):
+        pass
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {"phases": {}, "counters": {}}
+
+    def reset(self):
+        pass
+
+
+_null_instrumentation = _NullInstrumentation()
 
 
 class ConstructionSection:
@@ -86,15 +414,96 @@ class ConstructionSection:
         return self.sx, self.sy, self.sz
 
 
+_not_decoded = object()
+
+
+def _lazy_field(name: str) -> property:
+    """A property that decodes a ConstructionSection slot from the section NBT on first access."""
+    slot = getattr(ConstructionSection, name)
+
+    def fget(self: LazyConstructionSection):
+        value = slot.__get__(self)
+        if value is _not_decoded:
+            value = getattr(ConstructionReader, f"_decode_{name}")(
+                self._section_nbt, self.shape
+            )
+            if name == "blocks" and value is not None and self._palette_lut is not None:
+                value = self._palette_lut[value]
+            slot.__set__(self, value)
+        return value
+
+    def fset(self: LazyConstructionSection, value):
+        slot.__set__(self, value)
+
+    return property(fget, fset)
+
+
+class LazyConstructionSection(ConstructionSection):
+    """A ConstructionSection that decodes blocks, entities and block entities when first accessed."""
+
+    __slots__ = ("_section_nbt", "_palette_lut")
+
+    def __init__(
+        self,
+        min_position: INT_TRIPLET,
+        shape: INT_TRIPLET,
+        palette: List[Block],
+        section_nbt: Optional[amulet_nbt.NBTFile],
+        palette_lut: Optional[numpy.ndarray] = None,
+    ):
+        """
+        :param section_nbt: The section NBT to decode from. None if every field is set after creation.
+        :param palette_lut: If defined, the decoded block array is mapped through this into the palette.
+        """
+        self.sx, self.sy, self.sz = min_position
+        self.shape = shape
+        self.palette = palette
+        self._section_nbt = section_nbt
+        self._palette_lut = palette_lut
+        self.blocks = _not_decoded
+        self.entities = _not_decoded
+        self.block_entities = _not_decoded
+
+    blocks = _lazy_field("blocks")
+    entities = _lazy_field("entities")
+    block_entities = _lazy_field("block_entities")
+
+
 class ConstructionReader:
-    def __init__(self, file_or_buffer: Union[str, IO]):
+    def __init__(
+        self,
+        file_or_buffer: Union[str, IO],
+        use_mmap: bool = False,
+        thread_safe: bool = False,
+        cache_size: int = 0,
+        cache_read_only: bool = True,
+        instrumentation: Optional[Instrumentation] = None,
+    ):
+        """
+        :param file_or_buffer: The file path or readable buffer to read from.
+        :param use_mmap: Memory map the file and decompress sections straight from the mapping.
+            Buffers with a getbuffer method (eg BytesIO) are viewed directly.
+        :param thread_safe: Allow sections to be read from multiple threads at once.
+            Files are read with positional reads (or a handle per thread where os.pread is not available).
+            Other buffers fall back to a lock around each read.
+        :param cache_size: The approximate number of bytes of decoded sections to keep in memory. 0 to disable.
+        :param cache_read_only: If True cached sections are returned with read-only block arrays.
+            Otherwise each read returns a copy of the cached block array.
+            Each read returns new entity and block entity lists but the Entity and BlockEntity objects are shared.
+        :param instrumentation: If defined, the time and bytes of each phase of reading are recorded in this.
+        """
+        self._instrumentation = instrumentation or _null_instrumentation
         self._format_version: Optional[int] = None
         self._section_version: Optional[int] = None
+        self._section_compression = COMPRESSION_GZIP
+        self._metadata_compression = COMPRESSION_GZIP
 
+        self._path: Optional[str] = None
         if isinstance(file_or_buffer, str):
             assert os.path.isfile(
                 file_or_buffer
             ), f"There is no file located at {file_or_buffer}"
+            self._path = file_or_buffer
             self._buffer = open(file_or_buffer, "rb")
         else:
             assert hasattr(
@@ -102,6 +511,32 @@ class ConstructionReader:
             ), "Construction file buffer does not have a read mode"
             self._buffer = file_or_buffer
 
+        self._mmap: Optional[mmap.mmap] = None
+        self._view: Optional[memoryview] = None
+        if use_mmap:
+            if hasattr(self._buffer, "getbuffer"):
+                self._view = self._buffer.getbuffer()
+            else:
+                assert hasattr(
+                    self._buffer, "fileno"
+                ), "Construction file buffer can not be memory mapped"
+                self._mmap = mmap.mmap(
+                    self._buffer.fileno(), 0, access=mmap.ACCESS_READ
+                )
+                self._view = memoryview(self._mmap)
+
+        # the thread safe read strategy. Memory mapped files are already safe to share
+        self._thread_safe = thread_safe
+        self._lock = threading.Lock()
+        self._fileno: Optional[int] = None
+        self._thread_local: Optional[threading.local] = None
+        self._thread_handles: List[IO] = []
+        if thread_safe and self._view is None:
+            if hasattr(os, "pread") and self._has_fileno(self._buffer):
+                self._fileno = self._buffer.fileno()
+            elif self._path is not None:
+                self._thread_local = threading.local()
+
         self._source_edition: Optional[str] = None
         self._source_version: Optional[INT_TRIPLET] = None
 
@@ -110,34 +545,54 @@ class ConstructionReader:
         ] = None
 
         self._metadata: Optional[amulet_nbt.NBTFile] = None
-        self._section_index_table: Optional[
-            List[Tuple[int, int, int, int, int, int, int, int]]
-        ] = None
+        self._metadata_start: Optional[int] = None
+        # the (start, length, compression) of the metadata and palette if they are read on demand
+        self._metadata_location: Optional[Tuple[int, int, int]] = None
+        self._palette_location: Optional[Tuple[int, int, int]] = None
+        self._load_lock = threading.RLock()
+        self._section_index_table: Optional[numpy.ndarray] = None
+        # the sorted sub-chunk coordinates of the sections and the section indices in that order
+        self._sub_chunk_keys: Optional[numpy.ndarray] = None
+        self._sub_chunk_order: Optional[numpy.ndarray] = None
         self._palette: Optional[List[Block]] = None
+
+        self._section_cache: Optional[LRUCache] = None
+        if cache_size > 0:
+            self._section_cache = LRUCache(cache_size, self._decoded_section_size)
+        self._cache_read_only = cache_read_only
+
         self._init_read()
 
     @property
     def metadata(self) -> amulet_nbt.NBTFile:
-        return self._metadata
+        return self._load_metadata()
 
     @property
     def palette(self) -> List[Block]:
-        return self._palette.copy()
+        return self._get_palette().copy()
 
     @property
     def sections(self) -> List[Tuple[int, int, int, int, int, int, int, int]]:
-        return self._section_index_table.copy()
+        return self._section_index_table.tolist()
+
+    @property
+    def section_index_table(self) -> numpy.ndarray:
+        """The section index table as a structured array of SECTION_ENTRY_TYPE"""
+        return self._section_index_table.astype(SECTION_ENTRY_TYPE)
 
     @property
     def source_edition(self) -> str:
+        self._load_metadata()
         return self._source_edition
 
     @property
     def source_version(self) -> INT_TRIPLET:
+        self._load_metadata()
         return self._source_version
 
     @property
     def selection(self) -> List[Tuple[int, int, int, int, int, int]]:
+        self._load_metadata()
         return self._selection_boxes.copy()
 
     def __enter__(self):
@@ -150,80 +605,244 @@ class ConstructionReader:
     def _unpack_palette(raw_palette: amulet_nbt.TAG_List) -> List[Block]:
         block_palette = []
         extra_block_map = {}
+        block_keys = []
         for block_index, block_nbt in enumerate(raw_palette):
             block_nbt: amulet_nbt.TAG_Compound
             block_namespace = block_nbt["namespace"].value
             block_basename = block_nbt["blockname"].value
-            block = Block(
-                namespace=block_namespace,
-                base_name=block_basename,
-                properties=block_nbt["properties"].value,
+            block_key = (
+                block_namespace,
+                block_basename,
+                block_nbt["properties"].to_snbt(),
             )
+            block = palette_cache.get(block_key)
+            if block is None:
+                block = Block(
+                    namespace=block_namespace,
+                    base_name=block_basename,
+                    properties=block_nbt["properties"].value,
+                )
+                palette_cache.put(block_key, block)
 
             if block_nbt["extra_blocks"].value:
                 extra_block_map[block_index] = block_nbt["extra_blocks"].value
 
             block_palette.append(block)
+            block_keys.append(block_key)
 
         for block_index, extra_blocks in extra_block_map.items():
-            extra_block_objects = [block_palette[i.value] for i in extra_blocks]
+            block_key = (
+                block_keys[block_index],
+                *(block_keys[i.value] for i in extra_blocks),
+            )
+            resulting_block = palette_cache.get(block_key)
+            if resulting_block is None:
+                extra_block_objects = [block_palette[i.value] for i in extra_blocks]
 
-            resulting_block = block_palette[block_index]
-            for extra_block in extra_block_objects:
-                resulting_block = resulting_block + extra_block
+                resulting_block = block_palette[block_index]
+                for extra_block in extra_block_objects:
+                    resulting_block = resulting_block + extra_block
+                palette_cache.put(block_key, resulting_block)
 
             block_palette[block_index] = resulting_block
         return block_palette
 
+    @staticmethod
+    def _has_fileno(buffer: IO) -> bool:
+        try:
+            buffer.fileno()
+        except (AttributeError, OSError):
+            return False
+        return True
+
+    def _read_bytes(self, position: int, length: int) -> Union[bytes, memoryview]:
+        """Read length bytes from position. In mmap mode this is a zero-copy view into the file."""
+        with self._instrumentation.phase("io", length):
+            return self._read_bytes_raw(position, length)
+
+    def _read_bytes_raw(self, position: int, length: int) -> Union[bytes, memoryview]:
+        if self._view is not None:
+            return self._view[position : position + length]
+        elif self._fileno is not None:
+            data = os.pread(self._fileno, length, position)
+            while len(data) < length:
+                chunk = os.pread(self._fileno, length - len(data), position + len(data))
+                if not chunk:
+                    break
+                data += chunk
+            return data
+        elif self._thread_local is not None:
+            buffer = getattr(self._thread_local, "buffer", None)
+            if buffer is None:
+                buffer = self._thread_local.buffer = open(self._path, "rb")
+                with self._lock:
+                    self._thread_handles.append(buffer)
+            buffer.seek(position)
+            return buffer.read(length)
+        elif self._thread_safe:
+            with self._lock:
+                self._buffer.seek(position)
+                return self._buffer.read(length)
+        else:
+            self._buffer.seek(position)
+            return self._buffer.read(length)
+
+    def _file_size(self) -> int:
+        if self._view is not None:
+            return len(self._view)
+        return self._buffer.seek(0, os.SEEK_END)
+
     def _init_read(self):
         """data to be read at init in read mode"""
-        magic_num_1 = self._buffer.read(8)
+        magic_num_1 = self._read_bytes(0, magic_num_len)
         assert magic_num_1 == magic_num, f"This file is not a construction file."
-        self._format_version = struct.unpack(">B", self._buffer.read(1))[0]
-        if self._format_version == 0:
-            self._buffer.seek(-magic_num_len, os.SEEK_END)
-            magic_num_2 = self._buffer.read(8)
+        (self._format_version,) = struct.unpack(
+            ">B", self._read_bytes(magic_num_len, 1)
+        )
+        if self._format_version <= max_format_version:
+            if self._format_version >= 1:
+                (metadata_compression,) = struct.unpack(
+                    ">B", self._read_bytes(magic_num_len + 1, 1)
+                )
+            else:
+                metadata_compression = COMPRESSION_GZIP
+            self._metadata_compression = metadata_compression
+            file_size = self._file_size()
+            magic_num_2 = self._read_bytes(file_size - magic_num_len, magic_num_len)
             assert (
                 magic_num_2 == magic_num
             ), "It looks like this file is corrupt. It probably wasn't saved properly"
 
-            self._buffer.seek(-magic_num_len - INT_STRUCT.size, os.SEEK_END)
-            metadata_end = self._buffer.tell()
-            metadata_start = INT_STRUCT.unpack(self._buffer.read(INT_STRUCT.size))[0]
-            self._buffer.seek(metadata_start)
+            if self._format_version >= 2:
+                self._init_read_footer(file_size, metadata_compression)
+                return
 
-            metadata = amulet_nbt.load(
-                buffer=self._buffer.read(metadata_end - metadata_start),
-                compressed=True,
-            )
+            metadata_end = file_size - magic_num_len - INT_STRUCT.size
+            metadata_start = INT_STRUCT.unpack(
+                self._read_bytes(metadata_end, INT_STRUCT.size)
+            )[0]
 
-            try:
-                self._source_edition = metadata["export_version"]["edition"].value
-                self._source_version = tuple(
-                    map(lambda v: v.value, metadata["export_version"]["version"])
-                )
-            except KeyError as e:
-                raise AssertionError(
-                    f'Missing export version identifying key "{e.args[0]}"'
-                )
+            raw_metadata = self._read_bytes(
+                metadata_start, metadata_end - metadata_start
+            )
+            with self._instrumentation.phase("decompress", len(raw_metadata)):
+                raw_metadata = _decompress(raw_metadata, metadata_compression)
+            with self._instrumentation.phase("nbt_parse", len(raw_metadata)):
+                metadata = amulet_nbt.load(buffer=raw_metadata, compressed=False)
 
             self._section_version = metadata["section_version"].value
+            self._check_section_version()
+            if self._format_version >= 1:
+                self._section_compression = metadata["section_compression"].value
 
-            self._palette = self._unpack_palette(metadata["block_palette"])
+            with self._instrumentation.phase("palette_unpack"):
+                self._palette = self._unpack_palette(metadata["block_palette"])
 
-            self._selection_boxes = (
-                metadata["selection_boxes"].value.reshape(-1, 6).tolist()
-            )
-
-            self._section_index_table = (
-                metadata["section_index_table"].value.view(SECTION_ENTRY_TYPE).tolist()
+            self._section_index_table = metadata["section_index_table"].value.view(
+                SECTION_ENTRY_TYPE
             )
+            self._metadata_start = metadata_start
+            self._parse_metadata(metadata)
 
         else:
             raise Exception(
                 f"This wrapper doesn't support any construction version higher than {max_format_version}"
             )
 
+    def _check_section_version(self):
+        if self._section_version > max_section_version:
+            raise Exception(
+                f"This wrapper doesn't support any section version higher than {max_section_version}"
+            )
+
+    def _init_read_footer(self, file_size: int, metadata_compression: int):
+        """
+        Read the footer and tables of format version 2.
+        The tables are uncompressed so in mmap mode they are viewed in place.
+        The metadata and palette are read on demand.
+        """
+        footer_start = file_size - magic_num_len - FOOTER_STRUCT.size
+        (
+            self._section_version,
+            self._section_compression,
+            metadata_start,
+            metadata_length,
+            palette_start,
+            palette_length,
+            index_start,
+            section_count,
+        ) = FOOTER_STRUCT.unpack(self._read_bytes(footer_start, FOOTER_STRUCT.size))
+        self._check_section_version()
+        self._metadata_start = metadata_start
+        self._metadata_location = (
+            metadata_start,
+            metadata_length,
+            metadata_compression,
+        )
+        self._palette_location = (palette_start, palette_length, metadata_compression)
+
+        tables = self._read_bytes(index_start, footer_start - index_start)
+        keys_start = section_count * SECTION_ENTRY_TYPE_BE.itemsize
+        order_start = keys_start + section_count * SUB_CHUNK_KEY_TYPE_BE.itemsize
+        self._section_index_table = numpy.frombuffer(
+            tables, SECTION_ENTRY_TYPE_BE, section_count
+        )
+        self._sub_chunk_keys = numpy.frombuffer(
+            tables, SUB_CHUNK_KEY_TYPE_BE, section_count, keys_start
+        )
+        self._sub_chunk_order = numpy.frombuffer(
+            tables, SUB_CHUNK_ORDER_TYPE_BE, section_count, order_start
+        )
+
+    def _parse_metadata(self, metadata: amulet_nbt.NBTFile):
+        try:
+            self._source_edition = metadata["export_version"]["edition"].value
+            self._source_version = tuple(
+                map(lambda v: v.value, metadata["export_version"]["version"])
+            )
+        except KeyError as e:
+            raise AssertionError(
+                f'Missing export version identifying key "{e.args[0]}"'
+            )
+        self._selection_boxes = (
+            metadata["selection_boxes"].value.reshape(-1, 6).tolist()
+        )
+        # set last because it marks the metadata as loaded
+        self._metadata = metadata
+
+    def _load_metadata(self) -> amulet_nbt.NBTFile:
+        """Get the metadata, reading it if it has not been read yet."""
+        if self._metadata is None:
+            with self._load_lock:
+                if self._metadata is None:
+                    start, length, compression = self._metadata_location
+                    self._parse_metadata(
+                        self._load_section_nbt(
+                            self._read_bytes(start, length),
+                            compression,
+                            self._instrumentation,
+                        )
+                    )
+        return self._metadata
+
+    def _load_raw_palette(self) -> amulet_nbt.TAG_List:
+        if self._palette_location is None:
+            return self._load_metadata()["block_palette"]
+        start, length, compression = self._palette_location
+        return self._load_section_nbt(
+            self._read_bytes(start, length), compression, self._instrumentation
+        )["block_palette"]
+
+    def _get_palette(self) -> List[Block]:
+        """Get the palette, reading it if it has not been read yet."""
+        if self._palette is None:
+            with self._load_lock:
+                if self._palette is None:
+                    raw_palette = self._load_raw_palette()
+                    with self._instrumentation.phase("palette_unpack"):
+                        self._palette = self._unpack_palette(raw_palette)
+        return self._palette
+
     @staticmethod
     def _parse_entities(entities: amulet_nbt.TAG_List) -> List[Entity]:
         return [
@@ -252,8 +871,161 @@ class ConstructionReader:
             for block_entity in block_entities
         ]
 
-    def read(self, section_index: int):
-        if self._format_version == 0:
+    def _payload(self, section_index: int) -> Tuple[Union[bytes, memoryview], int]:
+        """The section data entry of a section and the id of its compression."""
+        *_, position, length = self._section_index_table[section_index].item()
+        self._check_stored(length)
+        return self._read_bytes(position, length), self._section_compression
+
+    def _check_stored(self, length: int):
+        """Raise a clear error for sections whose data is stored in the base of a delta."""
+        if length == 0 and "base" in self._load_metadata():
+            raise Exception(
+                "This construction is a delta. Read it with DeltaConstructionReader"
+            )
+
+    @staticmethod
+    def _load_section_nbt(
+        payload: Union[bytes, memoryview],
+        compression: int,
+        instrumentation: Instrumentation = _null_instrumentation,
+    ) -> amulet_nbt.NBTFile:
+        with instrumentation.phase("decompress", len(payload)):
+            data = _decompress(payload, compression)
+        with instrumentation.phase("nbt_parse", len(data)):
+            return amulet_nbt.load(buffer=data, compressed=False)
+
+    @staticmethod
+    def _decode_blocks(
+        nbt_obj: amulet_nbt.NBTFile, shape: INT_TRIPLET
+    ) -> Optional[numpy.ndarray]:
+        array_type = nbt_obj["blocks_array_type"].value
+        if array_type == -1:
+            return None
+        elif array_type == UNIFORM_ARRAY_TYPE:
+            return numpy.full(shape, nbt_obj["blocks"].value, dtype=numpy.int64)
+        elif array_type == BIT_PACKED_ARRAY_TYPE:
+            return numpy.reshape(
+                _unpack_bits(
+                    nbt_obj["blocks"].value,
+                    nbt_obj["blocks_bit_width"].value,
+                    int(numpy.prod(shape)),
+                ),
+                shape,
+            )
+        return numpy.reshape(nbt_obj["blocks"].value, shape)
+
+    @classmethod
+    def _decode_entities(
+        cls, nbt_obj: amulet_nbt.NBTFile, shape: INT_TRIPLET
+    ) -> List[Entity]:
+        return cls._parse_entities(nbt_obj["entities"])
+
+    @classmethod
+    def _decode_block_entities(
+        cls, nbt_obj: amulet_nbt.NBTFile, shape: INT_TRIPLET
+    ) -> Optional[List[BlockEntity]]:
+        if nbt_obj["blocks_array_type"].value == -1:
+            return None
+        return cls._parse_block_entities(nbt_obj["block_entities"])
+
+    @classmethod
+    def _decode_section(
+        cls,
+        payload: Union[bytes, memoryview],
+        shape: INT_TRIPLET,
+        compression: int,
+        instrumentation: Instrumentation = _null_instrumentation,
+    ) -> Tuple[Optional[numpy.ndarray], List[Entity], Optional[List[BlockEntity]]]:
+        """decompress and parse a section data entry into its blocks, entities and block entities"""
+        nbt_obj = cls._load_section_nbt(payload, compression, instrumentation)
+        with instrumentation.phase("blocks"):
+            blocks = cls._decode_blocks(nbt_obj, shape)
+        with instrumentation.phase("entities"):
+            entities = cls._decode_entities(nbt_obj, shape)
+            block_entities = cls._decode_block_entities(nbt_obj, shape)
+        return blocks, entities, block_entities
+
+    @staticmethod
+    def _decoded_section_size(
+        decoded: Tuple[
+            Optional[numpy.ndarray], List[Entity], Optional[List[BlockEntity]]
+        ]
+    ) -> int:
+        """an approximation of the memory used by a decoded section"""
+        blocks, entities, block_entities = decoded
+        size = 256
+        if blocks is not None:
+            size += blocks.nbytes
+        size += 1024 * len(entities)
+        if block_entities is not None:
+            size += 1024 * len(block_entities)
+        return size
+
+    def _cache_key(self, section_index: int) -> Tuple[int, int, int, int, int]:
+        """
+        The section cache key. Sections are cached by their payload location so that
+        deduplicated sections sharing a payload share a cache entry.
+        """
+        _, _, _, shapex, shapey, shapez, position, length = self._section_index_table[
+            section_index
+        ].item()
+        return position, length, shapex, shapey, shapez
+
+    @property
+    def cache_stats(self) -> Optional[Dict[str, int]]:
+        """The hit, miss and eviction counts and size of the section cache. None if caching is disabled."""
+        if self._section_cache is None:
+            return None
+        return self._section_cache.stats
+
+    def _create_section(
+        self,
+        section_index: int,
+        decoded: Tuple[
+            Optional[numpy.ndarray], List[Entity], Optional[List[BlockEntity]]
+        ],
+        cache: bool = True,
+    ) -> ConstructionSection:
+        sx, sy, sz, shapex, shapey, shapez, _, _ = self._section_index_table[
+            section_index
+        ].item()
+        blocks, entities, block_entities = decoded
+        self._instrumentation.count("sections")
+        if blocks is not None:
+            self._instrumentation.count("blocks", blocks.size)
+        self._instrumentation.count("entities", len(entities))
+        if block_entities is not None:
+            self._instrumentation.count("block_entities", len(block_entities))
+        if self._section_cache is not None:
+            if cache:
+                if blocks is not None:
+                    blocks.setflags(write=False)
+                self._section_cache.put(self._cache_key(section_index), decoded)
+            if not self._cache_read_only and blocks is not None:
+                blocks = blocks.copy()
+            # the lists are copied so that editing them does not modify the cached section
+            entities = list(entities)
+            if block_entities is not None:
+                block_entities = list(block_entities)
+        return ConstructionSection(
+            (sx, sy, sz),
+            (shapex, shapey, shapez),
+            blocks,
+            self._get_palette(),
+            entities,
+            block_entities,
+        )
+
+    def read(self, section_index: int, lazy: bool = False) -> ConstructionSection:
+        """
+        Read a section from the construction.
+
+        :param section_index: The index of the section in the section index table.
+        :param lazy: If True return a LazyConstructionSection that decodes the blocks,
+            entities and block entities when each is first accessed.
+        """
+        if self._format_version <= max_format_version:
             (
                 sx,
                 sy,
@@ -263,34 +1035,437 @@ class ConstructionReader:
                 shapez,
                 position,
                 length,
-            ) = self._section_index_table[section_index]
-            self._buffer.seek(position)
-            nbt_obj = amulet_nbt.load(buffer=self._buffer.read(length))
-            if nbt_obj["blocks_array_type"].value == -1:
-                blocks = None
-                block_entities = None
+            ) = self._section_index_table[section_index].item()
+            if self._section_cache is not None:
+                decoded = self._section_cache.get(self._cache_key(section_index))
+                if decoded is not None:
+                    section = self._create_section(section_index, decoded, False)
+                    if lazy:
+                        # wrap the cached values so that the return type does not depend on the cache
+                        lazy_section = LazyConstructionSection(
+                            section.location, section.shape, section.palette, None
+                        )
+                        lazy_section.blocks = section.blocks
+                        lazy_section.entities = section.entities
+                        lazy_section.block_entities = section.block_entities
+                        return lazy_section
+                    return section
+            payload, compression = self._payload(section_index)
+            if lazy:
+                self._instrumentation.count("sections")
+                return LazyConstructionSection(
+                    (sx, sy, sz),
+                    (shapex, shapey, shapez),
+                    self._get_palette(),
+                    self._load_section_nbt(payload, compression, self._instrumentation),
+                )
+            return self._create_section(
+                section_index,
+                self._decode_section(
+                    payload,
+                    (shapex, shapey, shapez),
+                    compression,
+                    self._instrumentation,
+                ),
+            )
+        else:
+            raise Exception(
+                f"This wrapper doesn't support any construction version higher than {max_format_version}"
+            )
+
+    def read_many(
+        self,
+        section_indices: Iterable[int],
+        workers: Optional[int] = None,
+        use_processes: bool = False,
+        ordered: bool = True,
+    ) -> Iterator[Tuple[int, ConstructionSection]]:
+        """
+        Decompress and parse many sections in parallel.
+        The file is read on the calling thread and the sections are decoded on a worker pool.
+
+        :param section_indices: The indices of the sections to read.
+        :param workers: The number of workers. Defaults to the cpu count.
+        :param use_processes: Decode in a process pool rather than a thread pool.
+        :param ordered: If True yield in the order requested otherwise yield as each section completes.
+        :return: An iterator of (section index, section) tuples.
+        """
+        if self._format_version > max_format_version:
+            raise Exception(
+                f"This wrapper doesn't support any construction version higher than {max_format_version}"
+            )
+        for section_index, _, _, decoded in self._decode_many(
+            ((section_index, self, section_index) for section_index in section_indices),
+            workers,
+            use_processes,
+            ordered,
+        ):
+            yield section_index, self._create_section(section_index, decoded)
+
+    @staticmethod
+    def _decode_many(
+        sections: Iterable[Tuple[Any, ConstructionReader, int]],
+        workers: Optional[int],
+        use_processes: bool,
+        ordered: bool,
+    ) -> Iterator[
+        Tuple[
+            Any,
+            ConstructionReader,
+            int,
+            Tuple[Optional[numpy.ndarray], List[Entity], Optional[List[BlockEntity]]],
+        ]
+    ]:
+        """
+        Decode sections from one or more readers on a single worker pool.
+        The payloads are read on the calling thread.
+
+        :param sections: (key, reader, section index) tuples of the sections to decode.
+        :return: An iterator of (key, reader, section index, decoded section) tuples.
+        """
+        workers = workers or os.cpu_count() or 1
+        if use_processes:
+            executor = concurrent.futures.ProcessPoolExecutor(workers)
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(workers)
+        # limit the number of payloads held in memory at once
+        max_pending = workers * 4
+        sections = iter(sections)
+        pending = collections.deque()
+
+        def submit() -> bool:
+            section = next(sections, None)
+            if section is None:
+                return False
+            _, reader, section_index = section
+            _, _, _, shapex, shapey, shapez, _, _ = reader._section_index_table[
+                section_index
+            ].item()
+            payload, compression = reader._payload(section_index)
+            if use_processes:
+                payload = bytes(payload)
+            pending.append(
+                (
+                    section,
+                    executor.submit(
+                        reader._decode_section,
+                        payload,
+                        (shapex, shapey, shapez),
+                        compression,
+                        # instrumentation can't be shared with other processes
+                        _null_instrumentation
+                        if use_processes
+                        else reader._instrumentation,
+                    ),
+                )
+            )
+            return True
+
+        try:
+            while len(pending) < max_pending and submit():
+                pass
+            if ordered:
+                while pending:
+                    section, future = pending.popleft()
+                    submit()
+                    yield (*section, future.result())
             else:
-                blocks = numpy.reshape(
-                    nbt_obj["blocks"].value, (shapex, shapey, shapez)
+                while pending:
+                    concurrent.futures.wait(
+                        [future for _, future in pending],
+                        return_when=concurrent.futures.FIRST_COMPLETED,
+                    )
+                    done = [entry for entry in pending if entry[1].done()]
+                    for entry in done:
+                        pending.remove(entry)
+                        submit()
+                    for section, future in done:
+                        yield (*section, future.result())
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _batch_sections(
+        self, section_indices: numpy.ndarray, batch_size: int
+    ) -> List[List[int]]:
+        """Split section indices sorted by file position into runs spanning at most batch_size bytes."""
+        positions = self._section_index_table["position"]
+        lengths = self._section_index_table["length"]
+        batches = []
+        batch = []
+        batch_start = 0
+        for section_index in section_indices.tolist():
+            position = int(positions[section_index])
+            end = position + int(lengths[section_index])
+            if batch and end - batch_start > batch_size:
+                batches.append(batch)
+                batch = []
+            if not batch:
+                batch_start = position
+            batch.append(section_index)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _decode_batch(
+        self, batch: List[int], start: int, data: Union[bytes, memoryview]
+    ) -> List[
+        Tuple[Optional[numpy.ndarray], List[Entity], Optional[List[BlockEntity]]]
+    ]:
+        data = memoryview(data)
+        decoded = []
+        for section_index in batch:
+            (
+                _,
+                _,
+                _,
+                shapex,
+                shapey,
+                shapez,
+                position,
+                length,
+            ) = self._section_index_table[section_index].item()
+            self._check_stored(length)
+            offset = position - start
+            decoded.append(
+                self._decode_section(
+                    data[offset : offset + length],
+                    (shapex, shapey, shapez),
+                    self._section_compression,
+                    self._instrumentation,
                 )
-                block_entities = self._parse_block_entities(nbt_obj["block_entities"])
+            )
+        return decoded
 
-            return ConstructionSection(
-                (sx, sy, sz),
-                (shapex, shapey, shapez),
-                blocks,
-                self._palette,
-                self._parse_entities(nbt_obj["entities"]),
-                block_entities,
+    def iter_sections(
+        self,
+        section_indices: Optional[Iterable[int]] = None,
+        batch_size: int = 2**23,
+        prefetch: bool = True,
+    ) -> Iterator[Tuple[int, ConstructionSection]]:
+        """
+        Iterate over sections in the order they are stored in the file.
+        Neighbouring sections are read in batches with one read call per batch.
+
+        :param section_indices: The indices of the sections to read. Defaults to all sections.
+        :param batch_size: The maximum number of bytes to read at once. Larger sections are read on their own.
+        :param prefetch: Decompress the next batch on a background thread while the current one is consumed.
+        :return: An iterator of (section index, section) tuples in file order.
+        """
+        if self._format_version > max_format_version:
+            raise Exception(
+                f"This wrapper doesn't support any construction version higher than {max_format_version}"
             )
+        if section_indices is None:
+            section_indices = numpy.arange(len(self._section_index_table))
         else:
+            section_indices = numpy.array(list(section_indices), dtype=numpy.int64)
+        section_indices = section_indices[
+            numpy.argsort(
+                self._section_index_table["position"][section_indices], kind="stable"
+            )
+        ]
+
+        def read_batch(batch: List[int]) -> Tuple[int, Union[bytes, memoryview]]:
+            start = int(self._section_index_table["position"][batch[0]])
+            end = max(
+                int(self._section_index_table["position"][section_index])
+                + int(self._section_index_table["length"][section_index])
+                for section_index in batch
+            )
+            return start, self._read_bytes(start, end - start)
+
+        batches = self._batch_sections(section_indices, batch_size)
+        if not prefetch:
+            for batch in batches:
+                for section_index, decoded in zip(
+                    batch, self._decode_batch(batch, *read_batch(batch))
+                ):
+                    yield section_index, self._create_section(section_index, decoded)
+            return
+
+        # the file is read on this thread so that iterating is safe alongside other reads
+        executor = concurrent.futures.ThreadPoolExecutor(1)
+        try:
+            pending = None
+            for batch in batches + [None]:
+                future = None
+                if batch is not None:
+                    future = executor.submit(
+                        self._decode_batch, batch, *read_batch(batch)
+                    )
+                if pending is not None:
+                    pending_batch, pending_future = pending
+                    for section_index, decoded in zip(
+                        pending_batch, pending_future.result()
+                    ):
+                        yield section_index, self._create_section(
+                            section_index, decoded
+                        )
+                pending = (batch, future)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _init_spatial_index(self):
+        table = self._section_index_table
+        keys = numpy.empty(len(table), dtype=SUB_CHUNK_KEY_TYPE)
+        keys["cx"] = table["sx"] >> 4
+        keys["cy"] = table["sy"] >> 4
+        keys["cz"] = table["sz"] >> 4
+        order = numpy.argsort(keys, kind="stable", order=("cx", "cy", "cz"))
+        self._sub_chunk_keys = keys[order]
+        self._sub_chunk_order = order
+
+    def sections_at_subchunk(self, cx: int, cy: int, cz: int) -> List[int]:
+        """The indices of the sections within the sub-chunk at the given sub-chunk coordinate."""
+        if self._sub_chunk_keys is None:
+            self._init_spatial_index()
+        key = numpy.array((cx, cy, cz), dtype=self._sub_chunk_keys.dtype)
+        start = numpy.searchsorted(self._sub_chunk_keys, key, side="left")
+        stop = numpy.searchsorted(self._sub_chunk_keys, key, side="right")
+        return self._sub_chunk_order[start:stop].tolist()
+
+    def sections_in_box(
+        self, min_point: INT_TRIPLET, max_point: INT_TRIPLET
+    ) -> List[int]:
+        """
+        The indices of the sections that intersect a box.
+
+        :param min_point: The minimum block coordinate of the box.
+        :param max_point: The maximum block coordinate of the box (exclusive).
+        :return: The section indices in ascending order.
+        """
+        if self._sub_chunk_keys is None:
+            self._init_spatial_index()
+        # sections are sorted by sub-chunk x so only the sub-chunk columns spanned by the box need checking
+        cx = self._sub_chunk_keys["cx"]
+        start = numpy.searchsorted(cx, min_point[0] >> 4, side="left")
+        stop = numpy.searchsorted(cx, (max_point[0] - 1) >> 4, side="right")
+        indices = self._sub_chunk_order[start:stop]
+        table = self._section_index_table[indices]
+        mask = numpy.ones(len(indices), dtype=bool)
+        for axis, (min_c, max_c) in zip("xyz", zip(min_point, max_point)):
+            start_c = table[f"s{axis}"]
+            mask &= start_c < max_c
+            mask &= start_c + table[f"shape{axis}"] > min_c
+        return numpy.sort(indices[mask]).tolist()
+
+    def read_volume(
+        self,
+        box: Optional[Tuple[int, int, int, int, int, int]] = None,
+        out: Optional[numpy.ndarray] = None,
+        fill_value: int = 0,
+    ) -> numpy.ndarray:
+        """
+        Assemble the blocks of the sections intersecting a box into one array.
+        Where sections overlap the later section takes priority.
+
+        :param box: The (min_x, min_y, min_z, max_x, max_y, max_z) box to read. The max point is exclusive.
+            Defaults to the bounds of the selection boxes or of the sections if there are no selection boxes.
+        :param out: The array to fill. Must be the shape of the box. May be a numpy.memmap.
+            Blocks not within a section are left unchanged.
+        :param fill_value: The value of blocks not within a section if out is not given.
+        :return: The array of indices into the palette.
+        """
+        if self._format_version > max_format_version:
             raise Exception(
                 f"This wrapper doesn't support any construction version higher than {max_format_version}"
             )
+        if box is None:
+            self._load_metadata()
+            if self._selection_boxes:
+                boxes = numpy.array(self._selection_boxes)
+                box = (*boxes[:, :3].min(axis=0), *boxes[:, 3:].max(axis=0))
+            elif len(self._section_index_table):
+                table = self._section_index_table
+                box = (
+                    table["sx"].min(),
+                    table["sy"].min(),
+                    table["sz"].min(),
+                    (table["sx"] + table["shapex"]).max(),
+                    (table["sy"] + table["shapey"]).max(),
+                    (table["sz"] + table["shapez"]).max(),
+                )
+            else:
+                box = (0, 0, 0, 0, 0, 0)
+        box_min = numpy.array(box[:3], dtype=numpy.int64)
+        box_max = numpy.array(box[3:], dtype=numpy.int64)
+        box_shape = tuple(numpy.maximum(box_max - box_min, 0).tolist())
+        if out is None:
+            out = numpy.full(box_shape, fill_value, dtype=numpy.uint32)
+        else:
+            assert out.shape == box_shape, "out does not match the shape of the box"
+
+        for section_index in self.sections_in_box(box_min, box_max):
+            (
+                sx,
+                sy,
+                sz,
+                shapex,
+                shapey,
+                shapez,
+                position,
+                length,
+            ) = self._section_index_table[section_index].item()
+            decoded = None
+            if self._section_cache is not None:
+                decoded = self._section_cache.get(self._cache_key(section_index))
+            if decoded is None:
+                nbt_obj = self._load_section_nbt(
+                    *self._payload(section_index), self._instrumentation
+                )
+                if nbt_obj["blocks_array_type"].value == UNIFORM_ARRAY_TYPE:
+                    # fill the region directly rather than creating the section array
+                    blocks = nbt_obj["blocks"].value
+                else:
+                    with self._instrumentation.phase("blocks"):
+                        blocks = self._decode_blocks(nbt_obj, (shapex, shapey, shapez))
+            else:
+                blocks = decoded[0]
+            self._instrumentation.count("sections")
+            if blocks is None:
+                continue
+            section_min = numpy.array((sx, sy, sz))
+            start = numpy.maximum(section_min, box_min)
+            stop = numpy.minimum(section_min + (shapex, shapey, shapez), box_max)
+            src_start = start - section_min
+            src_stop = stop - section_min
+            dst_start = start - box_min
+            dst_stop = stop - box_min
+            if isinstance(blocks, numpy.ndarray):
+                blocks = blocks[
+                    src_start[0] : src_stop[0],
+                    src_start[1] : src_stop[1],
+                    src_start[2] : src_stop[2],
+                ]
+            out[
+                dst_start[0] : dst_stop[0],
+                dst_start[1] : dst_stop[1],
+                dst_start[2] : dst_stop[2],
+            ] = blocks
+        return out
 
     def close(self):
+        self._release()
         self._buffer.close()
 
+    def _release(self):
+        """Release everything but the buffer."""
+        if self._section_cache is not None:
+            self._section_cache.clear()
+        # the tables may be views of the file which must be released before it is unmapped
+        self._section_index_table = None
+        self._sub_chunk_keys = None
+        self._sub_chunk_order = None
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        for buffer in self._thread_handles:
+            buffer.close()
+        self._thread_handles.clear()
+
 
 class ConstructionWriter:
     def __init__(
@@ -299,17 +1474,59 @@ class ConstructionWriter:
         source_edition: str,
         source_version: INT_TRIPLET,
         selection_boxes: Optional[List[Tuple[int, int, int, int, int, int]]] = None,
-        format_version: int = max_format_version,
-        section_version: int = max_section_version,
+        format_version: int = 0,
+        section_version: int = 0,
+        workers: int = 0,
+        use_processes: bool = False,
+        compression: str = "gzip",
+        compression_level: Optional[int] = None,
+        deduplicate: bool = False,
+        instrumentation: Optional[Instrumentation] = None,
+        base: Optional[str] = None,
     ):
+        """
+        :param file_or_buffer: The file path or writable buffer to write to.
+        :param source_edition: The game edition the data was exported from.
+        :param source_version: The game version the data was exported from.
+        :param selection_boxes: The boxes that were selected when exporting.
+        :param format_version: The construction format version to write.
+            Defaults to 0 which every reader supports. Versions 1 and 2 must be requested.
+        :param section_version: The section format version to write.
+            Bit-packed (1) and uniform (2) sections require format version 1 or above.
+        :param workers: If non-zero, sections are serialised and compressed on a pool of this many workers
+            and written in order as they complete.
+        :param use_processes: Use a process pool rather than a thread pool for the workers.
+        :param compression: The codec to compress the sections and metadata with.
+            One of "none", "gzip", "zlib", "zstd" (requires zstandard) or "lz4" (requires lz4).
+            Format version 0 only supports gzip.
+        :param compression_level: The codec specific compression level. Defaults to the codec's default.
+        :param deduplicate: If True, sections that serialise to the same bytes as an earlier section
+            are not written again. Their index entry points to the earlier payload instead.
+        :param instrumentation: If defined, the time and bytes of each phase of writing are recorded in this.
+        :param base: The path of a construction to write this construction as a delta against.
+            Sections with the same location, shape and data as a base section reference it rather than being stored.
+            The data matches if it is the same bytes or the same once decompressed.
+            Read the result with DeltaConstructionReader.
+        """
         assert (
             format_version <= max_format_version
         ), f"This construction writer does not support format versions above {max_format_version}"
+        assert (
+            format_version >= 1 or section_version == 0
+        ), "Format version 0 only supports section version 0"
         assert (
             section_version <= max_section_version
         ), f"This construction writer does not support section versions above {max_section_version}"
+        assert compression in compression_ids, f"Unknown compression {compression}"
+        assert (
+            format_version >= 1 or compression == "gzip"
+        ), "Format version 0 only supports gzip compression"
         self._format_version = format_version
         self._section_version = section_version
+        self._compression = compression_ids[compression]
+        # the metadata is compressed with the section codec
+        self._metadata_compression = self._compression
+        self._compression_level = compression_level
 
         if isinstance(file_or_buffer, str):
             self._buffer = open(file_or_buffer, "wb")
@@ -324,12 +1541,118 @@ class ConstructionWriter:
 
         self._selection_boxes = selection_boxes or []
 
+        self._init_state(workers, use_processes, deduplicate, instrumentation)
+        self._init_write()
+        if base is not None:
+            self._init_base(base, file_or_buffer)
+
+    @classmethod
+    def append(
+        cls,
+        file_or_buffer: Union[str, IO],
+        workers: int = 0,
+        use_processes: bool = False,
+        compression_level: Optional[int] = None,
+        deduplicate: bool = False,
+        instrumentation: Optional[Instrumentation] = None,
+    ) -> "ConstructionWriter":
+        """
+        Open an existing construction file to add or replace sections.
+        The metadata is removed from the end of the file and rewritten on close.
+        The existing section data is not read or rewritten unless the palette stores a block more than once.
+        Then the sections that use a later copy are written again using the first.
+
+        The format version, section version, compression and palette of the file are kept.
+
+        :param file_or_buffer: The file path or readable, writable and truncatable buffer to append to.
+        :param workers: See __init__.
+        :param use_processes: See __init__.
+        :param compression_level: See __init__.
+        :param deduplicate: See __init__. New sections are only deduplicated against other new sections.
+        :param instrumentation: See __init__. Reading the existing metadata is included.
+        :return: The writer. Closing it writes the new metadata.
+        """
+        if isinstance(file_or_buffer, str):
+            buffer = open(file_or_buffer, "r+b")
+        else:
+            assert hasattr(file_or_buffer, "write") and hasattr(
+                file_or_buffer, "truncate"
+            ), "Construction file buffer does not have a read and write mode"
+            buffer = file_or_buffer
+
+        try:
+            # the reader is not closed because that would close the buffer
+            reader = ConstructionReader(buffer, instrumentation=instrumentation)
+            self = cls.__new__(cls)
+            self._buffer = buffer
+            self._format_version = reader._format_version
+            self._section_version = reader._section_version
+            self._compression = reader._section_compression
+            # the header byte is not rewritten so the metadata codec must not change
+            self._metadata_compression = reader._metadata_compression
+            self._compression_level = compression_level
+            self._source_edition = reader.source_edition
+            self._source_version = reader.source_version
+            self._selection_boxes = reader.selection
+            self._init_state(workers, use_processes, deduplicate, instrumentation)
+            self._init_append(reader)
+        except BaseException:
+            if isinstance(file_or_buffer, str):
+                buffer.close()
+            raise
+        return self
+
+    def _init_state(
+        self,
+        workers: int,
+        use_processes: bool,
+        deduplicate: bool,
+        instrumentation: Optional[Instrumentation],
+    ):
+        self._instrumentation = instrumentation or _null_instrumentation
+        # instrumentation can't be shared with other processes
+        self._encode_instrumentation = (
+            _null_instrumentation if use_processes else self._instrumentation
+        )
         self._metadata: Optional[amulet_nbt.NBTFile] = None
         self._section_index_table: List[
             Tuple[int, int, int, int, int, int, int, int]
         ] = []
         self._palette: BlockManager = BlockManager()
-        self._init_write()
+        # section palette id -> (section palette, palette entries when cached, section palette index to construction palette index)
+        self._palette_luts: Dict[
+            int, Tuple[List[Block], Tuple[Block, ...], numpy.ndarray]
+        ] = {}
+        # payload hash -> position. None if deduplication is disabled
+        self._payload_locations: Optional[Dict[bytes, int]] = (
+            {} if deduplicate else None
+        )
+        # the construction this is a delta against. None if this is not a delta
+        self._base: Optional[Union[ConstructionReader, DeltaConstructionReader]] = None
+        # section location and shape -> base section index
+        self._base_locations: Dict[Tuple[int, int, int, int, int, int], int] = {}
+        # section index -> (base section index, base section data hash) of the sections that reference the base
+        self._base_references: Dict[int, Tuple[int, bytes]] = {}
+
+        self._executor: Optional[concurrent.futures.Executor] = None
+        self._max_pending = workers * 4
+        self._pending: Deque[
+            Tuple[Tuple[int, int, int, int, int, int], concurrent.futures.Future]
+        ] = collections.deque()
+        if workers:
+            if use_processes:
+                self._executor = concurrent.futures.ProcessPoolExecutor(workers)
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(workers)
+
+    @property
+    def palette(self) -> List[Block]:
+        """The construction palette. Arrays passed to write_indexed index into this."""
+        return list(self._palette.blocks())
+
+    def get_add_block(self, block: Block) -> int:
+        """Get the construction palette index of a block, adding it if it is not already present."""
+        return self._palette.get_add_block(block)
 
     def __enter__(self):
         return self
@@ -341,7 +1664,10 @@ class ConstructionWriter:
         """data to be written at init in write mode"""
         self._buffer.write(magic_num)
         self._buffer.write(struct.pack(">B", self._format_version))
-        if self._format_version == 0:
+        if self._format_version >= 1:
+            # the compression of the metadata is needed before it can be read
+            self._buffer.write(struct.pack(">B", self._metadata_compression))
+        if self._format_version <= max_format_version:
             self._metadata = amulet_nbt.NBTFile(
                 amulet_nbt.TAG_Compound(
                     {
@@ -355,7 +1681,6 @@ class ConstructionWriter:
                                 for c in box
                             ]
                         ),
-                        "section_version": amulet_nbt.TAG_Byte(self._section_version),
                         "export_version": amulet_nbt.TAG_Compound(
                             {
                                 "edition": amulet_nbt.TAG_String(self._source_edition),
@@ -370,14 +1695,133 @@ class ConstructionWriter:
                     }
                 )
             )
+            if self._format_version < 2:
+                # from format version 2 these are stored in the footer
+                self._metadata["section_version"] = amulet_nbt.TAG_Byte(
+                    self._section_version
+                )
+                if self._format_version >= 1:
+                    self._metadata["section_compression"] = amulet_nbt.TAG_Byte(
+                        self._compression
+                    )
         else:
             raise Exception(
                 f"This wrapper doesn't support any construction version higher than {max_format_version}"
             )
 
+    def _init_append(self, reader: ConstructionReader):
+        """data to be read at init in append mode"""
+        self._metadata = reader.metadata
+        assert (
+            "base" not in self._metadata
+        ), "Appending to a delta construction is not supported"
+        lut = self._seed_palette(reader)
+        # these are rebuilt on close
+        for key in ("block_palette", "section_index_table"):
+            if key in self._metadata:
+                del self._metadata[key]
+
+        self._section_index_table = reader.sections
+        # sections that use a block index that changed in the palette are written again.
+        # They are read before the metadata is truncated because the reader shares the buffer.
+        changed_sections = {}
+        if not numpy.array_equal(lut, numpy.arange(len(lut))):
+            for section_index in range(len(reader.sections)):
+                section = reader.read(section_index)
+                if (
+                    section.blocks is not None
+                    and (lut[section.blocks] != section.blocks).any()
+                ):
+                    changed_sections[section_index] = section
+        self._buffer.seek(reader._metadata_start)
+        self._buffer.truncate()
+        for section_index, section in changed_sections.items():
+            self.replace(section_index, section)
+
+    def _init_base(self, base: str, file_or_buffer: Union[str, IO]):
+        """data to be read at init in delta mode"""
+        self._base = _open_construction(base, use_mmap=True)
+        # the base block indices are valid in this construction unless the base palette has duplicate blocks.
+        # Base sections are only referenced when they match the encoded section so they are valid either way.
+        self._seed_palette(self._base)
+        base_table = self._base.section_index_table
+        for base_index, (*entry, _, _) in enumerate(base_table.tolist()):
+            self._base_locations.setdefault(tuple(entry), base_index)
+
+        base_path = os.path.abspath(base)
+        if isinstance(file_or_buffer, str):
+            try:
+                relative_path = os.path.relpath(
+                    base_path, os.path.dirname(os.path.abspath(file_or_buffer))
+                )
+            except ValueError:
+                # the paths are on different drives
+                pass
+            else:
+                if not relative_path.startswith(os.pardir):
+                    base_path = relative_path.replace(os.sep, "/")
+        self._metadata["base"] = amulet_nbt.TAG_Compound(
+            {
+                "path": amulet_nbt.TAG_String(base_path),
+                "section_count": amulet_nbt.TAG_Int(len(base_table)),
+                "index_hash": amulet_nbt.TAG_Byte_Array(
+                    numpy.frombuffer(_section_index_hash(base_table), dtype=numpy.int8)
+                ),
+            }
+        )
+
+    def _seed_palette(self, reader: ConstructionReader) -> numpy.ndarray:
+        """
+        Add the palette of an existing construction so that its block indices are valid in this writer.
+        Older writers could store a block more than once. Each copy maps to the first.
+
+        :return: The construction palette index to writer palette index array.
+            This is the identity unless the construction palette has duplicate blocks.
+        """
+        assert len(self._palette) == 0, "The palette must be empty"
+        # the whole palette is kept in order because the spec does not require
+        # the entries referenced by extra_blocks to be after those used by the sections
+        return numpy.array(
+            [self._palette.get_add_block(block) for block in reader._get_palette()],
+            dtype=numpy.uint32,
+        )
+
+    def _copy_sections(
+        self, reader: ConstructionReader, section_indices: Iterable[int]
+    ):
+        """
+        Copy section data entries from a construction byte for byte.
+        The section version and compression of the construction must match this writer
+        and its block indices must be valid in this writer's palette.
+        Sections a delta reads from a base with a different compression are compressed again.
+        """
+        assert (
+            reader._section_version == self._section_version
+            and reader._section_compression == self._compression
+        ), "The section format does not match"
+        self._flush_pending()
+        # source payload key -> destination (position, length)
+        locations: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        for section_index in section_indices:
+            entry = tuple(reader._section_index_table[section_index].item()[:6])
+            # sections that share data in the source share it in the destination
+            payload_key = reader._cache_key(section_index)[:2]
+            if payload_key in locations:
+                self._section_index_table.append((*entry, *locations[payload_key]))
+            else:
+                payload, compression = reader._payload(section_index)
+                if compression != self._compression:
+                    payload = _compress(
+                        _decompress(payload, compression),
+                        self._compression,
+                        self._compression_level,
+                    )
+                self._write_payload(entry, payload)
+                locations[payload_key] = self._section_index_table[-1][6:]
+
     @staticmethod
     def _generate_block_entry(
-        _block: Block, _palette_len, _extra_blocks
+        _block: Block, _extra_block_indices: Dict[Block, int]
     ) -> amulet_nbt.TAG_Compound:
         return amulet_nbt.TAG_Compound(
             {
@@ -386,9 +1830,7 @@ class ConstructionWriter:
                 "properties": amulet_nbt.TAG_Compound(_block.properties),
                 "extra_blocks": amulet_nbt.TAG_List(
                     [
-                        amulet_nbt.TAG_Int(
-                            _palette_len + _extra_blocks.index(_extra_block)
-                        )
+                        amulet_nbt.TAG_Int(_extra_block_indices[_extra_block])
                         for _extra_block in _block.extra_blocks
                     ]
                 ),
@@ -434,46 +1876,140 @@ class ConstructionWriter:
         )
 
     def _pack_palette(self) -> amulet_nbt.TAG_List:
+        return self._pack_blocks(list(self._palette.blocks()))
+
+    @classmethod
+    def _pack_blocks(cls, blocks: List[Block]) -> amulet_nbt.TAG_List:
+        """
+        serialise a list of blocks into a block palette.
+        Extra blocks that are not already in the list are added to the end
+        """
         block_palette_nbt = amulet_nbt.TAG_List()
-        extra_blocks = set()
-
-        for block in self._palette.blocks():
-            if len(block.extra_blocks) > 0:
-                extra_blocks.update(block.extra_blocks)
-
-        extra_blocks = list(extra_blocks)
-
-        palette_len = len(self._palette)
-        for block_entry in self._palette.blocks():
-            block_palette_nbt.append(
-                self._generate_block_entry(block_entry, palette_len, extra_blocks)
-            )
+        # block -> palette index of the blocks that are used as extra blocks
+        extra_block_indices: Dict[Block, int] = {}
+        block_indices = {block: block_index for block_index, block in enumerate(blocks)}
+        extra_blocks = []
+        for block in blocks:
+            for extra_block in block.extra_blocks:
+                if extra_block not in extra_block_indices:
+                    if extra_block in block_indices:
+                        extra_block_indices[extra_block] = block_indices[extra_block]
+                    else:
+                        extra_block_indices[extra_block] = len(blocks) + len(
+                            extra_blocks
+                        )
+                        extra_blocks.append(extra_block)
 
-        for extra_block in extra_blocks:
+        for block_entry in blocks + extra_blocks:
             block_palette_nbt.append(
-                self._generate_block_entry(extra_block, palette_len, extra_blocks)
+                cls._generate_block_entry(block_entry, extra_block_indices)
             )
         return block_palette_nbt
 
     def _exit_write(self):
         """data to be written at close in write mode"""
-        if self._format_version == 0:
+        if self._format_version <= max_format_version:
             metadata_start = self._buffer.tell()
-            self._metadata["section_index_table"] = amulet_nbt.TAG_Byte_Array(
-                numpy.array(self._section_index_table, dtype=SECTION_ENTRY_TYPE).view(
-                    numpy.int8
+            if self._base is not None:
+                base_section_indices = numpy.full(
+                    len(self._section_index_table), -1, dtype=numpy.int32
                 )
-            )
-            self._metadata["block_palette"] = self._pack_palette()
-            self._metadata.save_to(self._buffer)
-            self._buffer.write(INT_STRUCT.pack(metadata_start))
-            self._buffer.write(magic_num)
+                base_section_hashes = numpy.zeros(
+                    (len(self._section_index_table), 20), dtype=numpy.uint8
+                )
+                for section_index, (
+                    base_index,
+                    base_hash,
+                ) in self._base_references.items():
+                    base_section_indices[section_index] = base_index
+                    base_section_hashes[section_index] = numpy.frombuffer(
+                        base_hash, dtype=numpy.uint8
+                    )
+                self._metadata["base_section_indices"] = amulet_nbt.TAG_Int_Array(
+                    base_section_indices
+                )
+                self._metadata["base_section_hashes"] = amulet_nbt.TAG_Byte_Array(
+                    base_section_hashes.ravel().view(numpy.int8)
+                )
+            with self._instrumentation.phase("palette_pack"):
+                block_palette = self._pack_palette()
+            if self._format_version >= 2:
+                self._write_tables(metadata_start, block_palette)
+            else:
+                self._metadata["section_index_table"] = amulet_nbt.TAG_Byte_Array(
+                    numpy.array(
+                        self._section_index_table, dtype=SECTION_ENTRY_TYPE
+                    ).view(numpy.int8)
+                )
+                self._metadata["block_palette"] = block_palette
+                self._write_nbt(self._metadata)
+                with self._instrumentation.phase("io", INT_STRUCT.size + magic_num_len):
+                    self._buffer.write(INT_STRUCT.pack(metadata_start))
+                    self._buffer.write(magic_num)
         else:
             raise Exception(
                 f"This wrapper doesn't support any construction version higher than {max_format_version}"
             )
         self._buffer.close()
 
+    def _write_nbt(self, nbt: amulet_nbt.NBTFile) -> int:
+        """serialise, compress and write an NBT object returning the number of bytes written"""
+        with self._instrumentation.phase("nbt_serialise") as phase:
+            data = nbt.save_to(compressed=False)
+            phase.bytes = len(data)
+        with self._instrumentation.phase("compress", len(data)):
+            data = _compress(
+                data,
+                self._metadata_compression,
+                # the level is specific to the section codec
+                self._compression_level
+                if self._metadata_compression == self._compression
+                else None,
+            )
+        with self._instrumentation.phase("io", len(data)):
+            self._buffer.write(data)
+        return len(data)
+
+    def _write_tables(self, metadata_start: int, block_palette: amulet_nbt.TAG_List):
+        """write the metadata, palette, uncompressed tables and footer of format version 2"""
+        metadata_length = self._write_nbt(self._metadata)
+        palette_start = metadata_start + metadata_length
+        palette_length = self._write_nbt(
+            amulet_nbt.NBTFile(
+                amulet_nbt.TAG_Compound({"block_palette": block_palette})
+            )
+        )
+        index_start = palette_start + palette_length
+
+        section_index_table = numpy.array(
+            self._section_index_table, dtype=SECTION_ENTRY_TYPE_BE
+        )
+        keys = numpy.empty(len(section_index_table), dtype=SUB_CHUNK_KEY_TYPE_BE)
+        keys["cx"] = section_index_table["sx"] >> 4
+        keys["cy"] = section_index_table["sy"] >> 4
+        keys["cz"] = section_index_table["sz"] >> 4
+        order = numpy.argsort(keys, kind="stable", order=("cx", "cy", "cz"))
+        tables = b"".join(
+            (
+                section_index_table.tobytes(),
+                keys[order].tobytes(),
+                order.astype(SUB_CHUNK_ORDER_TYPE_BE).tobytes(),
+                FOOTER_STRUCT.pack(
+                    self._section_version,
+                    self._compression,
+                    metadata_start,
+                    metadata_length,
+                    palette_start,
+                    palette_length,
+                    index_start,
+                    len(section_index_table),
+                ),
+                magic_num,
+            )
+        )
+        with self._instrumentation.phase("io", len(tables)):
+            self._buffer.write(tables)
+
     @staticmethod
     def _find_fitting_array_type(
         array: numpy.ndarray,
@@ -493,53 +2029,1257 @@ class ConstructionWriter:
         else:
             return amulet_nbt.TAG_Long_Array
 
+    def _get_palette_lut(self, palette: List[Block]) -> numpy.ndarray:
+        """
+        Get the cached lookup table from a section palette to the construction palette.
+        Unmapped entries are -1.
+        Sections commonly share one palette object so the table is cached against the palette object.
+        Palettes may be appended to between writes. If existing entries are modified the table is rebuilt.
+        """
+        palette_id = id(palette)
+        entries = tuple(palette)
+        cached = self._palette_luts.get(palette_id)
+        # the palette is stored with the table so the id can't be reused while cached.
+        # the entries are compared by identity first so this is cheap for unmodified palettes
+        if cached is not None and entries[: len(cached[1])] == cached[1]:
+            _, _, lut = cached
+            if len(lut) < len(entries):
+                lut = numpy.concatenate(
+                    [lut, numpy.full(len(entries) - len(lut), -1, dtype=numpy.int64)]
+                )
+        else:
+            if cached is None and len(self._palette_luts) >= 64:
+                del self._palette_luts[next(iter(self._palette_luts))]
+            lut = numpy.full(len(entries), -1, dtype=numpy.int64)
+        self._palette_luts[palette_id] = (palette, entries, lut)
+        return lut
+
+    def _remap_blocks(
+        self, blocks: numpy.ndarray, palette: List[Block]
+    ) -> numpy.ndarray:
+        """convert the section's block array into a flat array of indices into the construction palette"""
+        with self._instrumentation.phase("remap", blocks.nbytes):
+            flattened_array = blocks.ravel()
+            lut = self._get_palette_lut(palette)
+            used = numpy.zeros(len(lut), dtype=bool)
+            used[flattened_array] = True
+            # add new blocks in ascending section palette order so the construction palette order is deterministic
+            for palette_index in numpy.flatnonzero(used & (lut == -1)).tolist():
+                lut[palette_index] = self._palette.get_add_block(palette[palette_index])
+            return lut[flattened_array]
+
+    @classmethod
+    def _encode_section(
+        cls,
+        entities: List[Entity],
+        flattened_array: Optional[numpy.ndarray],
+        block_entities: Optional[List[BlockEntity]],
+        compression: int,
+        compression_level: Optional[int],
+        section_version: int = 0,
+        instrumentation: Instrumentation = _null_instrumentation,
+    ) -> bytes:
+        """serialise and compress a section data entry"""
+        with instrumentation.phase("entities"):
+            _tag = amulet_nbt.TAG_Compound(
+                {"entities": cls._serialise_entities(entities)}
+            )
+            if flattened_array is not None:
+                _tag["block_entities"] = cls._serialise_block_entities(
+                    block_entities or []
+                )
+
+        with instrumentation.phase("blocks"):
+            if flattened_array is None:
+                _tag["blocks_array_type"] = amulet_nbt.TAG_Byte(-1)
+            elif (
+                section_version >= 2
+                and flattened_array.size
+                and (flattened_array == flattened_array[0]).all()
+            ):
+                _tag["blocks_array_type"] = amulet_nbt.TAG_Byte(UNIFORM_ARRAY_TYPE)
+                _tag["blocks"] = amulet_nbt.TAG_Long(int(flattened_array[0]))
+            elif section_version >= 1:
+                bit_width = max(1, int(flattened_array.max(initial=0)).bit_length())
+                _tag["blocks_array_type"] = amulet_nbt.TAG_Byte(BIT_PACKED_ARRAY_TYPE)
+                _tag["blocks_bit_width"] = amulet_nbt.TAG_Byte(bit_width)
+                _tag["blocks"] = amulet_nbt.TAG_Byte_Array(
+                    _pack_bits(flattened_array, bit_width).view(numpy.int8)
+                )
+            else:
+                array_type = cls._find_fitting_array_type(flattened_array)
+                _tag["blocks_array_type"] = amulet_nbt.TAG_Byte(array_type().tag_id)
+                _tag["blocks"] = array_type(flattened_array)
+
+        with instrumentation.phase("nbt_serialise") as phase:
+            data = amulet_nbt.NBTFile(_tag).save_to(compressed=False)
+            phase.bytes = len(data)
+        with instrumentation.phase("compress", len(data)):
+            return _compress(data, compression, compression_level)
+
+    def _match_base(self, base_index: int, payload: bytes) -> Optional[bytes]:
+        """
+        If a section data entry is the same as that of a base section byte for byte or once decompressed
+        return the hash of the base section data entry. Otherwise return None.
+        """
+        base_payload, base_compression = self._base._payload(base_index)
+        if not (base_compression == self._compression and base_payload == payload):
+            with self._instrumentation.phase(
+                "decompress", len(payload) + len(base_payload)
+            ):
+                if _decompress(payload, self._compression) != _decompress(
+                    base_payload, base_compression
+                ):
+                    return None
+        return _payload_hash(base_payload, base_compression)
+
+    def _write_payload(
+        self, entry: Tuple[int, int, int, int, int, int], payload: bytes
+    ):
+        if self._base is not None:
+            base_index = self._base_locations.get(entry)
+            base_hash = None
+            if base_index is not None:
+                base_hash = self._match_base(base_index, payload)
+            if base_hash is not None:
+                # the section data is read from the base
+                self._base_references[len(self._section_index_table)] = (
+                    base_index,
+                    base_hash,
+                )
+                self._section_index_table.append((*entry, 0, 0))
+                return
+        with self._instrumentation.phase("io", len(payload)):
+            if self._payload_locations is None:
+                position = self._buffer.tell()
+                self._buffer.write(payload)
+            else:
+                payload_hash = hashlib.blake2b(payload, digest_size=20).digest()
+                position = self._payload_locations.get(payload_hash)
+                if position is None:
+                    position = self._payload_locations[
+                        payload_hash
+                    ] = self._buffer.tell()
+                    self._buffer.write(payload)
+        self._section_index_table.append((*entry, position, len(payload)))
+
+    def _flush_pending(self, max_pending: int = 0):
+        """write completed payloads in order until at most max_pending are outstanding"""
+        while self._pending and (
+            len(self._pending) > max_pending or self._pending[0][1].done()
+        ):
+            entry, future = self._pending.popleft()
+            self._write_payload(entry, future.result())
+
     def write(self, section: ConstructionSection):
-        if self._section_version == 0:
+        """Write a section. The block array indexes into the section's palette."""
+        if section.blocks is None:
+            self._write(section, None)
+        elif (
+            self._section_version >= 2
+            and section.blocks.size
+            and (section.blocks == section.blocks.flat[0]).all()
+        ):
+            # only the one block needs remapping
+            self._write(
+                section,
+                numpy.broadcast_to(
+                    self._remap_blocks(section.blocks.flat[:1], section.palette),
+                    section.blocks.size,
+                ),
+            )
+        else:
+            self._write(section, self._remap_blocks(section.blocks, section.palette))
+
+    def replace(self, section_index: int, section: ConstructionSection):
+        """
+        Replace the section at an index in the section index table with a new section.
+        The old section data is left in the file but is no longer referenced.
+        """
+        self._flush_pending()
+        assert (
+            0 <= section_index < len(self._section_index_table)
+        ), "Section index is out of range"
+        self.write(section)
+        self._flush_pending()
+        self._section_index_table[section_index] = self._section_index_table.pop()
+        base_reference = self._base_references.pop(len(self._section_index_table), None)
+        if base_reference is None:
+            self._base_references.pop(section_index, None)
+        else:
+            self._base_references[section_index] = base_reference
+
+    def write_indexed(self, section: ConstructionSection):
+        """
+        Write a section whose block array already indexes into this writer's palette.
+        The section palette is ignored. Use get_add_block to find the index of each block.
+        """
+        if section.blocks is None:
+            self._write(section, None)
+        else:
+            flattened_array = section.blocks.ravel()
+            assert flattened_array.min(initial=0) >= 0 and flattened_array.max(
+                initial=0
+            ) < len(self._palette), "Block index is not in the construction palette"
+            self._write(section, flattened_array)
+
+    def write_volume(
+        self,
+        origin: INT_TRIPLET,
+        blocks: numpy.ndarray,
+        palette: List[Block],
+        entities: Iterable[Entity] = (),
+        block_entities: Iterable[BlockEntity] = (),
+        skip_index: Optional[int] = None,
+    ):
+        """
+        Split a volume of blocks into sub-chunk aligned sections and write them.
+
+        :param origin: The minimum block coordinate of the volume.
+        :param blocks: A 3D array of indices into palette.
+        :param palette: The block palette of the volume.
+        :param entities: The entities within the volume.
+        :param block_entities: The block entities within the volume.
+        :param skip_index: If defined, sections made entirely of this palette index are not written
+            unless they contain entities or block entities.
+        """
+        assert blocks.ndim == 3, "The block array must be 3D"
+        if not blocks.size:
+            return
+        origin = numpy.array(origin, dtype=numpy.int64)
+        volume_shape = numpy.array(blocks.shape, dtype=numpy.int64)
+        sub_chunk_min = origin >> 4
+        grid_shape = ((origin + volume_shape - 1) >> 4) - sub_chunk_min + 1
+        offset = origin - (sub_chunk_min << 4)
+
+        blocks = self._remap_blocks(blocks, palette).reshape(blocks.shape)
+        if offset.any() or (grid_shape * 16 != volume_shape).any():
+            # pad the volume out to whole sub-chunks. -1 marks blocks outside the volume
+            padded = numpy.full(grid_shape * 16, -1, dtype=blocks.dtype)
+            padded[
+                offset[0] : offset[0] + volume_shape[0],
+                offset[1] : offset[1] + volume_shape[1],
+                offset[2] : offset[2] + volume_shape[2],
+            ] = blocks
+            blocks = padded
+        # axis 0, 2 and 4 are the sub-chunk coordinates and 1, 3 and 5 the coordinates within the sub-chunk
+        grid = blocks.reshape(grid_shape[0], 16, grid_shape[1], 16, grid_shape[2], 16)
+
+        if skip_index is None:
+            skip = numpy.zeros(grid_shape, dtype=bool)
+        else:
+            skip_value = self._get_palette_lut(palette)[skip_index]
+            skip = ((grid == skip_value) | (grid == -1)).all(axis=(1, 3, 5))
+
+        volume_min = origin
+        volume_max = origin + volume_shape
+        section_entities = collections.defaultdict(list)
+        for entity in entities:
+            location = numpy.floor([entity.x, entity.y, entity.z]).astype(numpy.int64)
+            assert (volume_min <= location).all() and (
+                location < volume_max
+            ).all(), "Entity is not within the volume"
+            section_entities[tuple((location >> 4) - sub_chunk_min)].append(entity)
+        section_block_entities = collections.defaultdict(list)
+        for block_entity in block_entities:
+            location = numpy.array([block_entity.x, block_entity.y, block_entity.z])
+            assert (volume_min <= location).all() and (
+                location < volume_max
+            ).all(), "Block entity is not within the volume"
+            section_block_entities[tuple((location >> 4) - sub_chunk_min)].append(
+                block_entity
+            )
+
+        for grid_index in numpy.ndindex(*grid_shape):
+            if (
+                skip[grid_index]
+                and grid_index not in section_entities
+                and grid_index not in section_block_entities
+            ):
+                continue
+            chunk_min = (sub_chunk_min + grid_index) << 4
+            section_min = numpy.maximum(chunk_min, volume_min)
+            start = section_min - chunk_min
+            stop = numpy.minimum(chunk_min + 16, volume_max) - chunk_min
+            section_blocks = grid[
+                grid_index[0],
+                start[0] : stop[0],
+                grid_index[1],
+                start[1] : stop[1],
+                grid_index[2],
+                start[2] : stop[2],
+            ]
+            # the blocks have already been remapped to the construction palette
+            self._write(
+                ConstructionSection(
+                    tuple(section_min.tolist()),
+                    section_blocks.shape,
+                    section_blocks,
+                    palette,
+                    section_entities.get(grid_index, []),
+                    section_block_entities.get(grid_index, []),
+                ),
+                section_blocks.ravel(),
+            )
+
+    def _write(
+        self, section: ConstructionSection, flattened_array: Optional[numpy.ndarray]
+    ):
+        if self._section_version <= max_section_version:
             sx, sy, sz = section.location
             shapex, shapey, shapez = section.shape
-            blocks = section.blocks
             entities = section.entities
             block_entities = section.block_entities
-            palette = section.palette
             for point, shape in zip((sx, sy, sz), (shapex, shapey, shapez)):
                 assert shape >= 0, "Shape must be positive"
                 assert point + shape <= (
                     ((point >> 4) + 1) << 4
                 ), "Section does not fit in a sub-chunk"
-            position = self._buffer.tell()
 
-            _tag = amulet_nbt.TAG_Compound(
-                {"entities": self._serialise_entities(entities)}
+            self._instrumentation.count("sections")
+            if flattened_array is not None:
+                self._instrumentation.count("blocks", flattened_array.size)
+            self._instrumentation.count("entities", len(entities))
+            if block_entities is not None:
+                self._instrumentation.count("block_entities", len(block_entities))
+
+            entry = (sx, sy, sz, shapex, shapey, shapez)
+            if self._executor is None:
+                self._write_payload(
+                    entry,
+                    self._encode_section(
+                        entities,
+                        flattened_array,
+                        block_entities,
+                        self._compression,
+                        self._compression_level,
+                        self._section_version,
+                        self._instrumentation,
+                    ),
+                )
+            else:
+                self._pending.append(
+                    (
+                        entry,
+                        self._executor.submit(
+                            self._encode_section,
+                            entities,
+                            flattened_array,
+                            block_entities,
+                            self._compression,
+                            self._compression_level,
+                            self._section_version,
+                            self._encode_instrumentation,
+                        ),
+                    )
+                )
+                self._flush_pending(self._max_pending)
+        else:
+            raise Exception(
+                f"This wrapper doesn't support any section version higher than {max_section_version}"
             )
 
-            if blocks is None:
-                _tag["blocks_array_type"] = amulet_nbt.TAG_Byte(-1)
+    def close(self):
+        if self._executor is not None:
+            try:
+                self._flush_pending()
+            finally:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+        self._exit_write()
+        self._buffer.close()
+        if self._base is not None:
+            self._base.close()
+            self._base = None
+
+
+class AsyncConstructionReader:
+    """An asyncio wrapper around ConstructionReader that reads and decodes in an executor."""
+
+    def __init__(
+        self,
+        file_or_buffer: Union[str, IO],
+        executor: Optional[concurrent.futures.Executor] = None,
+        **kwargs,
+    ):
+        """
+        :param file_or_buffer: The file path or readable buffer to read from.
+        :param executor: The executor to run in. Defaults to the event loop's default executor.
+        :param kwargs: Other arguments passed to ConstructionReader. thread_safe defaults to True.
+        """
+        kwargs.setdefault("thread_safe", True)
+        self._file_or_buffer = file_or_buffer
+        self._kwargs = kwargs
+        self._executor = executor
+        self._reader: Optional[ConstructionReader] = None
+
+    async def _run(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def open(self) -> AsyncConstructionReader:
+        self._reader = await self._run(
+            ConstructionReader, self._file_or_buffer, **self._kwargs
+        )
+        return self
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @property
+    def reader(self) -> ConstructionReader:
+        """The wrapped reader. Its properties are safe to use but its methods block."""
+        return self._reader
+
+    @property
+    def palette(self) -> List[Block]:
+        return self._reader.palette
+
+    @property
+    def sections(self) -> List[Tuple[int, int, int, int, int, int, int, int]]:
+        return self._reader.sections
+
+    @property
+    def selection(self) -> List[Tuple[int, int, int, int, int, int]]:
+        return self._reader.selection
+
+    async def read(self, section_index: int, lazy: bool = False) -> ConstructionSection:
+        return await self._run(self._reader.read, section_index, lazy)
+
+    async def iter(
+        self,
+        section_indices: Optional[Iterable[int]] = None,
+        batch_size: int = 2**23,
+    ) -> AsyncIterator[ConstructionSection]:
+        """
+        Iterate over sections in the order they are stored in the file.
+        The next section is decoded while the current one is being consumed.
+        See ConstructionReader.iter_sections.
+        """
+        iterator = self._reader.iter_sections(section_indices, batch_size, False)
+        future = asyncio.ensure_future(self._run(next, iterator, None))
+        try:
+            while True:
+                item = await future
+                if item is None:
+                    break
+                future = asyncio.ensure_future(self._run(next, iterator, None))
+                yield item[1]
+        finally:
+            if not future.done():
+                await future
+            iterator.close()
+
+    async def read_volume(
+        self,
+        box: Optional[Tuple[int, int, int, int, int, int]] = None,
+        out: Optional[numpy.ndarray] = None,
+        fill_value: int = 0,
+    ) -> numpy.ndarray:
+        return await self._run(self._reader.read_volume, box, out, fill_value)
+
+    async def close(self):
+        if self._reader is not None:
+            await self._run(self._reader.close)
+
+
+class AsyncConstructionWriter:
+    """
+    An asyncio wrapper around ConstructionWriter that serialises, compresses and writes in an executor.
+    Calls are run one at a time in the order they are made.
+    """
+
+    def __init__(
+        self,
+        *args,
+        executor: Optional[concurrent.futures.Executor] = None,
+        **kwargs,
+    ):
+        """
+        :param args: Arguments passed to ConstructionWriter.
+        :param executor: The executor to run in. Defaults to the event loop's default executor.
+        :param kwargs: Other arguments passed to ConstructionWriter.
+        """
+        self._args = args
+        self._kwargs = kwargs
+        self._executor = executor
+        self._writer: Optional[ConstructionWriter] = None
+        # created on first use so that it belongs to the running event loop
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def _run(self, func, *args, **kwargs):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, functools.partial(func, *args, **kwargs)
+            )
+
+    async def open(self) -> AsyncConstructionWriter:
+        self._writer = await self._run(ConstructionWriter, *self._args, **self._kwargs)
+        return self
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @property
+    def writer(self) -> ConstructionWriter:
+        """The wrapped writer. Its methods block."""
+        return self._writer
+
+    async def write(self, section: ConstructionSection):
+        await self._run(self._writer.write, section)
+
+    async def write_indexed(self, section: ConstructionSection):
+        await self._run(self._writer.write_indexed, section)
+
+    async def write_volume(self, *args, **kwargs):
+        await self._run(self._writer.write_volume, *args, **kwargs)
+
+    async def close(self):
+        if self._writer is not None:
+            await self._run(self._writer.close)
+
+
+def extract(
+    source: Union[str, IO],
+    destination: Union[str, IO],
+    boxes: Optional[Iterable[Tuple[int, int, int, int, int, int]]] = None,
+    section_indices: Optional[Iterable[int]] = None,
+    prune_palette: bool = False,
+) -> int:
+    """
+    Write a new construction holding the sections of a construction that intersect any of the boxes
+    or are in section_indices. Sections are kept whole rather than being cut at the box edges.
+
+    The section data is copied byte for byte and the palette is copied as it is.
+    The format version, section version and compression of the source are kept.
+    If the source is a delta the sections it reads from its base are copied so the result is not a delta.
+
+    :param source: The file path or readable buffer of the construction to extract from.
+    :param destination: The file path or writable buffer to write the new construction to.
+    :param boxes: The (min_x, min_y, min_z, max_x, max_y, max_z) boxes to extract. The max point is exclusive.
+        These become the selection boxes of the new construction. Defaults to the source selection boxes.
+    :param section_indices: The indices of extra sections to extract.
+    :param prune_palette: Remove the unused blocks from the palette.
+        The sections have to be decoded, remapped and compressed again to do this.
+    :return: The number of sections written.
+    """
+    compression_names = {
+        compression_id: name for name, compression_id in compression_ids.items()
+    }
+    with _open_construction(
+        source, use_mmap=isinstance(source, str) or hasattr(source, "getbuffer")
+    ) as reader:
+        selected = set()
+        if boxes is not None:
+            boxes = [tuple(box) for box in boxes]
+            for box in boxes:
+                selected.update(reader.sections_in_box(box[:3], box[3:]))
+        if section_indices is not None:
+            selected.update(section_indices)
+        selected = sorted(selected)
+
+        writer = ConstructionWriter(
+            destination,
+            reader.source_edition,
+            reader.source_version,
+            reader.selection if boxes is None else boxes,
+            format_version=reader._format_version,
+            section_version=reader._section_version,
+            compression=compression_names[reader._section_compression],
+        )
+        try:
+            if prune_palette:
+                for section_index in selected:
+                    writer.write(reader.read(section_index))
             else:
-                flattened_array = blocks.ravel()
-                index, flattened_array = numpy.unique(
-                    flattened_array, return_inverse=True
+                lut = writer._seed_palette(reader)
+                if numpy.array_equal(lut, numpy.arange(len(lut))):
+                    writer._copy_sections(reader, selected)
+                else:
+                    # the palette has duplicate blocks so the block arrays are remapped
+                    for section_index in selected:
+                        section = reader.read(section_index)
+                        if section.blocks is not None:
+                            section.blocks = lut[section.blocks]
+                        writer.write_indexed(section)
+        finally:
+            writer.close()
+    return len(selected)
+
+
+def merge(
+    sources: List[Union[str, IO]],
+    destination: Union[str, IO],
+    selection_boxes: Optional[List[Tuple[int, int, int, int, int, int]]] = None,
+    format_version: int = 0,
+    section_version: int = 0,
+    compression: str = "gzip",
+    compression_level: Optional[int] = None,
+    workers: int = 0,
+    use_processes: bool = False,
+    instrumentation: Optional[Instrumentation] = None,
+) -> int:
+    """
+    Combine construction files into one construction with a combined palette.
+    The sections of each source are written in order after those of the previous source.
+
+    The combined palette starts with the palette of the first source.
+    Where a source's palette indices are unchanged in the combined palette and its section version
+    and compression match the destination its section data is copied byte for byte.
+    Otherwise its block arrays are remapped to the combined palette and compressed again.
+    Sources that are deltas are read through their base so the result is not a delta.
+
+    :param sources: The file paths or readable buffers of the constructions to merge.
+    :param destination: The file path or writable buffer to write the combined construction to.
+    :param selection_boxes: The selection boxes of the combined construction.
+        Defaults to the selection boxes of all the sources.
+    :param format_version: The construction format version to write.
+    :param section_version: The section format version to write.
+    :param compression: The codec to compress with.
+    :param compression_level: The codec specific compression level of remapped sections.
+    :param workers: If non-zero, remapped sections are compressed on a pool of this many workers.
+    :param use_processes: Use a process pool rather than a thread pool for the workers.
+    :param instrumentation: If defined, the time and bytes of each phase of writing are recorded in this.
+        Only remapped sections are counted in the section counters.
+    :return: The number of sections written.
+    """
+    assert sources, "At least one source is required"
+    readers: List[ConstructionReader] = []
+    section_count = 0
+    try:
+        for source in sources:
+            readers.append(
+                _open_construction(
+                    source,
+                    use_mmap=isinstance(source, str) or hasattr(source, "getbuffer"),
                 )
-                palette = numpy.array(palette, dtype=object)[index]
-                lut = numpy.vectorize(self._palette.get_add_block)(palette)
-                flattened_array = lut[flattened_array]
-                array_type = self._find_fitting_array_type(flattened_array)
-                _tag["blocks_array_type"] = amulet_nbt.TAG_Byte(array_type().tag_id)
-                _tag["blocks"] = array_type(flattened_array)
-                _tag["block_entities"] = self._serialise_block_entities(
-                    block_entities or []
+            )
+        export_version = (readers[0].source_edition, readers[0].source_version)
+        assert all(
+            (reader.source_edition, reader.source_version) == export_version
+            for reader in readers
+        ), "The sources were exported from different game versions"
+        if selection_boxes is None:
+            selection_boxes = [box for reader in readers for box in reader.selection]
+
+        writer = ConstructionWriter(
+            destination,
+            *export_version,
+            selection_boxes,
+            format_version=format_version,
+            section_version=section_version,
+            compression=compression,
+            compression_level=compression_level,
+            workers=workers,
+            use_processes=use_processes,
+            instrumentation=instrumentation,
+        )
+        try:
+            for reader in readers:
+                # source palette index -> combined palette index
+                lut = numpy.array(
+                    [writer.get_add_block(block) for block in reader._get_palette()],
+                    dtype=numpy.uint32,
+                )
+                section_indices = range(len(reader.sections))
+                if (
+                    numpy.array_equal(lut, numpy.arange(len(lut)))
+                    and reader._section_version == writer._section_version
+                    and reader._section_compression == writer._compression
+                ):
+                    writer._copy_sections(reader, section_indices)
+                else:
+                    for section_index in section_indices:
+                        section = reader.read(section_index)
+                        if section.blocks is not None:
+                            section.blocks = lut[section.blocks]
+                        writer.write_indexed(section)
+                section_count += len(section_indices)
+        finally:
+            writer.close()
+    finally:
+        for reader in readers:
+            reader.close()
+    return section_count
+
+
+max_manifest_version = 0
+
+
+def _section_index_hash(section_index_table: numpy.ndarray) -> bytes:
+    """A hash of a section index table used to check that a referenced file has not changed."""
+    return hashlib.blake2b(
+        section_index_table.astype(SECTION_ENTRY_TYPE_BE).tobytes(), digest_size=20
+    ).digest()
+
+
+def _palette_hash(raw_palette: amulet_nbt.TAG_List) -> bytes:
+    """A hash of a block palette used to check that a referenced file has not changed."""
+    return hashlib.blake2b(
+        amulet_nbt.NBTFile(
+            amulet_nbt.TAG_Compound({"block_palette": raw_palette})
+        ).save_to(compressed=False),
+        digest_size=20,
+    ).digest()
+
+
+def build_manifest(
+    manifest_path: str,
+    shard_paths: List[str],
+    selection_boxes: Optional[List[Tuple[int, int, int, int, int, int]]] = None,
+):
+    """
+    Merge the indices and palettes of independently written construction files into a manifest.
+    The shards are not modified. Only their metadata is read.
+    Read the result with ShardedConstructionReader.
+
+    :param manifest_path: The path to write the manifest to.
+    :param shard_paths: The paths of the shard construction files.
+        Stored relative to the manifest directory if they are in or below it otherwise stored as absolute paths.
+    :param selection_boxes: The selection boxes of the combined construction.
+        Defaults to the selection boxes of all the shards.
+    """
+    manifest_directory = os.path.dirname(os.path.abspath(manifest_path))
+    palette = BlockManager()
+    shards = amulet_nbt.TAG_List()
+    section_index_tables = []
+    shard_selection_boxes = []
+    export_version = None
+    for shard_path in shard_paths:
+        with ConstructionReader(shard_path) as reader:
+            shard_export_version = (reader.source_edition, reader.source_version)
+            if export_version is None:
+                export_version = shard_export_version
+            assert (
+                export_version == shard_export_version
+            ), f"{shard_path} was exported from a different game version"
+            # shard palette index -> combined palette index
+            lut = numpy.array(
+                [palette.get_add_block(block) for block in reader.palette],
+                dtype=numpy.int32,
+            )
+            section_index_tables.append(reader.section_index_table)
+            shard_selection_boxes += reader.selection
+            index_hash = _section_index_hash(section_index_tables[-1])
+            palette_hash = _palette_hash(reader._load_raw_palette())
+
+        stored_path = os.path.abspath(shard_path)
+        try:
+            relative_path = os.path.relpath(stored_path, manifest_directory)
+        except ValueError:
+            # the paths are on different drives
+            pass
+        else:
+            if not relative_path.startswith(os.pardir):
+                stored_path = relative_path.replace(os.sep, "/")
+        shards.append(
+            amulet_nbt.TAG_Compound(
+                {
+                    "path": amulet_nbt.TAG_String(stored_path),
+                    "section_count": amulet_nbt.TAG_Int(len(section_index_tables[-1])),
+                    "index_hash": amulet_nbt.TAG_Byte_Array(
+                        numpy.frombuffer(index_hash, dtype=numpy.int8)
+                    ),
+                    "palette_hash": amulet_nbt.TAG_Byte_Array(
+                        numpy.frombuffer(palette_hash, dtype=numpy.int8)
+                    ),
+                    "palette_lut": amulet_nbt.TAG_Int_Array(lut),
+                }
+            )
+        )
+
+    assert export_version is not None, "At least one shard is required"
+    if selection_boxes is None:
+        selection_boxes = shard_selection_boxes
+    section_index_table = numpy.concatenate(section_index_tables)
+    manifest = amulet_nbt.NBTFile(
+        amulet_nbt.TAG_Compound(
+            {
+                "manifest_version": amulet_nbt.TAG_Byte(max_manifest_version),
+                "created_with": amulet_nbt.TAG_String("amulet_python_wrapper"),
+                "selection_boxes": amulet_nbt.TAG_Int_Array(
+                    [c for box in selection_boxes for c in box]
+                ),
+                "export_version": amulet_nbt.TAG_Compound(
+                    {
+                        "edition": amulet_nbt.TAG_String(export_version[0]),
+                        "version": amulet_nbt.TAG_List(
+                            [amulet_nbt.TAG_Int(v) for v in export_version[1]]
+                        ),
+                    }
+                ),
+                "shards": shards,
+                "section_index_table": amulet_nbt.TAG_Byte_Array(
+                    section_index_table.view(numpy.int8)
+                ),
+                "block_palette": ConstructionWriter._pack_blocks(
+                    list(palette.blocks())
+                ),
+            }
+        )
+    )
+    with open(manifest_path, "wb") as f:
+        f.write(_compress(manifest.save_to(compressed=False), COMPRESSION_GZIP))
+
+
+class ShardedConstructionReader:
+    """
+    Read a construction split over many files as one construction.
+    Sections are indexed in shard order and their block arrays index into the combined palette.
+    Each shard is opened when it is first read from.
+    """
+
+    def __init__(self, manifest_path: str, **kwargs):
+        """
+        :param manifest_path: The path of a manifest written by build_manifest.
+        :param kwargs: Arguments passed to the ConstructionReader of each shard.
+        """
+        with open(manifest_path, "rb") as f:
+            manifest = amulet_nbt.load(buffer=_gunzip(f.read()), compressed=False)
+        if manifest["manifest_version"].value > max_manifest_version:
+            raise Exception(
+                f"This wrapper doesn't support any manifest version higher than {max_manifest_version}"
+            )
+        self._manifest = manifest
+        self._kwargs = kwargs
+        manifest_directory = os.path.dirname(os.path.abspath(manifest_path))
+        self._shard_paths = [
+            os.path.join(manifest_directory, shard["path"].value)
+            for shard in manifest["shards"]
+        ]
+        self._palette_luts = [
+            shard["palette_lut"].value.astype(numpy.int64)
+            for shard in manifest["shards"]
+        ]
+        # the global index of the first section of each shard
+        self._shard_starts = numpy.cumsum(
+            [0] + [shard["section_count"].value for shard in manifest["shards"]]
+        )
+        self._shards: List[Optional[ConstructionReader]] = [None] * len(
+            self._shard_paths
+        )
+        self._lock = threading.Lock()
+
+        self._source_edition = manifest["export_version"]["edition"].value
+        self._source_version = tuple(
+            v.value for v in manifest["export_version"]["version"]
+        )
+        self._selection_boxes = (
+            manifest["selection_boxes"].value.reshape(-1, 6).tolist()
+        )
+        self._section_index_table = manifest["section_index_table"].value.view(
+            SECTION_ENTRY_TYPE
+        )
+        self._sub_chunk_keys: Optional[numpy.ndarray] = None
+        self._sub_chunk_order: Optional[numpy.ndarray] = None
+        self._palette = ConstructionReader._unpack_palette(manifest["block_palette"])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def metadata(self) -> amulet_nbt.NBTFile:
+        """The manifest."""
+        return self._manifest
+
+    @property
+    def palette(self) -> List[Block]:
+        return self._palette.copy()
+
+    @property
+    def sections(self) -> List[Tuple[int, int, int, int, int, int, int, int]]:
+        """The section index table entries. The position and length are within the section's shard."""
+        return self._section_index_table.tolist()
+
+    @property
+    def section_index_table(self) -> numpy.ndarray:
+        return self._section_index_table.copy()
+
+    @property
+    def source_edition(self) -> str:
+        return self._source_edition
+
+    @property
+    def source_version(self) -> INT_TRIPLET:
+        return self._source_version
+
+    @property
+    def selection(self) -> List[Tuple[int, int, int, int, int, int]]:
+        return self._selection_boxes.copy()
+
+    @property
+    def shard_count(self) -> int:
+        return len(self._shard_paths)
+
+    def locate(self, section_index: int) -> Tuple[int, int]:
+        """The shard index and the index within that shard of a section."""
+        assert (
+            0 <= section_index < self._shard_starts[-1]
+        ), "Section index is out of range"
+        shard_index = int(
+            numpy.searchsorted(self._shard_starts, section_index, side="right") - 1
+        )
+        return shard_index, section_index - int(self._shard_starts[shard_index])
+
+    def shard(self, shard_index: int) -> ConstructionReader:
+        """The reader of a shard. Its block arrays index into the shard's own palette."""
+        if self._shards[shard_index] is None:
+            with self._lock:
+                if self._shards[shard_index] is None:
+                    self._shards[shard_index] = self._open_shard(shard_index)
+        return self._shards[shard_index]
+
+    def _open_shard(self, shard_index: int) -> ConstructionReader:
+        shard_path = self._shard_paths[shard_index]
+        shard = self._manifest["shards"][shard_index]
+        reader = ConstructionReader(shard_path, **self._kwargs)
+        table = reader.section_index_table
+        if (
+            len(table) != shard["section_count"].value
+            or bytes(shard["index_hash"].value) != _section_index_hash(table)
+            or bytes(shard["palette_hash"].value)
+            != _palette_hash(reader._load_raw_palette())
+        ):
+            reader.close()
+            raise AssertionError(
+                f"{shard_path} has changed since the manifest was built"
+            )
+        return reader
+
+    def _remap_section(
+        self, shard_index: int, section: ConstructionSection
+    ) -> ConstructionSection:
+        if isinstance(section, LazyConstructionSection):
+            remapped = LazyConstructionSection(
+                section.location,
+                section.shape,
+                self._palette,
+                section._section_nbt,
+                self._palette_luts[shard_index],
+            )
+            # fields that are already decoded (eg from the shard's section cache) are carried over
+            for name in ("blocks", "entities", "block_entities"):
+                value = getattr(ConstructionSection, name).__get__(section)
+                if value is not _not_decoded:
+                    if name == "blocks" and value is not None:
+                        value = self._palette_luts[shard_index][value]
+                    setattr(remapped, name, value)
+            return remapped
+        blocks = section.blocks
+        if blocks is not None:
+            blocks = self._palette_luts[shard_index][blocks]
+        return ConstructionSection(
+            section.location,
+            section.shape,
+            blocks,
+            self._palette,
+            section.entities,
+            section.block_entities,
+        )
+
+    def read(self, section_index: int, lazy: bool = False) -> ConstructionSection:
+        """
+        Read a section from the construction.
+
+        :param section_index: The index of the section in the combined section index table.
+        :param lazy: See ConstructionReader.read.
+        """
+        shard_index, local_index = self.locate(section_index)
+        return self._remap_section(
+            shard_index, self.shard(shard_index).read(local_index, lazy)
+        )
+
+    def read_many(
+        self,
+        section_indices: Iterable[int],
+        workers: Optional[int] = None,
+        use_processes: bool = False,
+        ordered: bool = True,
+    ) -> Iterator[Tuple[int, ConstructionSection]]:
+        """
+        Decompress and parse many sections in parallel.
+        The sections of every shard are decoded on one worker pool.
+
+        :param section_indices: The indices of the sections to read.
+        :param workers: See ConstructionReader.read_many.
+        :param use_processes: See ConstructionReader.read_many.
+        :param ordered: See ConstructionReader.read_many.
+        :return: An iterator of (section index, section) tuples.
+        """
+
+        def sections() -> Iterator[Tuple[Tuple[int, int], ConstructionReader, int]]:
+            for section_index in section_indices:
+                shard_index, local_index = self.locate(section_index)
+                yield (section_index, shard_index), self.shard(shard_index), local_index
+
+        for (
+            (section_index, shard_index),
+            shard,
+            local_index,
+            decoded,
+        ) in ConstructionReader._decode_many(
+            sections(), workers, use_processes, ordered
+        ):
+            yield section_index, self._remap_section(
+                shard_index, shard._create_section(local_index, decoded)
+            )
+
+    def iter_sections(
+        self, section_indices: Optional[Iterable[int]] = None, **kwargs
+    ) -> Iterator[Tuple[int, ConstructionSection]]:
+        """
+        Iterate over sections one shard at a time.
+
+        :param section_indices: The indices of the sections to read. Defaults to all sections.
+        :param kwargs: Arguments passed to ConstructionReader.iter_sections.
+        :return: An iterator of (section index, section) tuples in shard then file order.
+        """
+        if section_indices is None:
+            section_indices = numpy.arange(self._shard_starts[-1])
+        else:
+            section_indices = numpy.array(list(section_indices), dtype=numpy.int64)
+        shard_indices = (
+            numpy.searchsorted(self._shard_starts, section_indices, side="right") - 1
+        )
+        for shard_index in numpy.unique(shard_indices).tolist():
+            shard_start = int(self._shard_starts[shard_index])
+            for local_index, section in self.shard(shard_index).iter_sections(
+                section_indices[shard_indices == shard_index] - shard_start, **kwargs
+            ):
+                yield shard_start + local_index, self._remap_section(
+                    shard_index, section
+                )
+
+    # the spatial index is built from the combined section index table so no shard is opened
+    _init_spatial_index = ConstructionReader._init_spatial_index
+    sections_at_subchunk = ConstructionReader.sections_at_subchunk
+    sections_in_box = ConstructionReader.sections_in_box
+
+    def read_volume(
+        self,
+        box: Optional[Tuple[int, int, int, int, int, int]] = None,
+        out: Optional[numpy.ndarray] = None,
+        fill_value: int = 0,
+    ) -> numpy.ndarray:
+        """
+        Assemble the blocks of the sections intersecting a box into one array.
+        Where sections overlap the later section takes priority.
+        Only the shards with a section in the box are opened.
+
+        :param box: See ConstructionReader.read_volume.
+        :param out: See ConstructionReader.read_volume.
+        :param fill_value: See ConstructionReader.read_volume.
+        :return: The array of indices into the combined palette.
+        """
+        if box is None:
+            if self._selection_boxes:
+                boxes = numpy.array(self._selection_boxes)
+                box = (*boxes[:, :3].min(axis=0), *boxes[:, 3:].max(axis=0))
+            elif len(self._section_index_table):
+                table = self._section_index_table
+                box = (
+                    table["sx"].min(),
+                    table["sy"].min(),
+                    table["sz"].min(),
+                    (table["sx"] + table["shapex"]).max(),
+                    (table["sy"] + table["shapey"]).max(),
+                    (table["sz"] + table["shapez"]).max(),
                 )
+            else:
+                box = (0, 0, 0, 0, 0, 0)
+        box_min = numpy.array(box[:3], dtype=numpy.int64)
+        box_max = numpy.array(box[3:], dtype=numpy.int64)
+        box_shape = tuple(numpy.maximum(box_max - box_min, 0).tolist())
+        if out is None:
+            out = numpy.full(box_shape, fill_value, dtype=numpy.uint32)
+        else:
+            assert out.shape == box_shape, "out does not match the shape of the box"
+
+        section_indices = self.sections_in_box(box_min, box_max)
+        shard_indices = (
+            numpy.searchsorted(self._shard_starts, section_indices, side="right") - 1
+        )
+        # blocks not within a section of the shard keep this value so they are not copied
+        not_written = numpy.iinfo(numpy.uint32).max
+        for shard_index in numpy.unique(shard_indices).tolist():
+            shard_blocks = self.shard(shard_index).read_volume(
+                (*box_min, *box_max), fill_value=not_written
+            )
+            mask = shard_blocks != not_written
+            out[mask] = self._palette_luts[shard_index][shard_blocks[mask]]
+        return out
 
-            amulet_nbt.NBTFile(_tag).save_to(self._buffer)
+    @property
+    def cache_stats(self) -> Optional[Dict[str, int]]:
+        """
+        The section cache statistics summed over the shards that have been opened.
+        Each shard has its own cache. None if caching is disabled.
+        """
+        if not self._kwargs.get("cache_size"):
+            return None
+        stats = dict.fromkeys(
+            ("hits", "misses", "evictions", "entries", "size", "max_size"), 0
+        )
+        for reader in self._shards:
+            if reader is not None:
+                for key, value in reader.cache_stats.items():
+                    stats[key] += value
+        return stats
 
-            length = self._buffer.tell() - position
-            self._section_index_table.append(
-                (sx, sy, sz, shapex, shapey, shapez, position, length)
+    def close(self):
+        for shard_index, reader in enumerate(self._shards):
+            if reader is not None:
+                reader.close()
+                self._shards[shard_index] = None
+
+
+def _payload_hash(payload: Union[bytes, memoryview], compression: int) -> bytes:
+    """A hash of a section data entry used to check that a referenced section has not changed."""
+    payload_hash = hashlib.blake2b(struct.pack(">B", compression), digest_size=20)
+    payload_hash.update(payload)
+    return payload_hash.digest()
+
+
+def _open_construction(
+    file_or_buffer: Union[str, IO], **kwargs
+) -> Union[ConstructionReader, DeltaConstructionReader]:
+    """Open a construction with DeltaConstructionReader if it is a delta otherwise with ConstructionReader."""
+    reader = ConstructionReader(file_or_buffer, **kwargs)
+    if "base" not in reader.metadata:
+        return reader
+    if isinstance(file_or_buffer, str):
+        reader.close()
+    else:
+        # the buffer is reused by the delta reader
+        reader._release()
+    return DeltaConstructionReader(file_or_buffer, **kwargs)
+
+
+class DeltaConstructionReader(ConstructionReader):
+    """
+    Read a construction written as a delta against a base construction.
+    Sections that reference the base are read from the base, which may itself be a delta.
+    Block arrays index into the delta palette, which base section data is also read with.
+    """
+
+    def __init__(
+        self,
+        file_or_buffer: Union[str, IO],
+        base: Optional[Union[str, IO]] = None,
+        **kwargs,
+    ):
+        """
+        :param file_or_buffer: The file path or readable buffer of the delta.
+        :param base: The file path or readable buffer of the base construction.
+            Defaults to the path stored in the delta. A relative path is relative to the delta's directory.
+        :param kwargs: Arguments passed to ConstructionReader for the delta and the base.
+        """
+        super().__init__(file_or_buffer, **kwargs)
+        try:
+            metadata = self.metadata
+            assert "base" in metadata, "This construction is not a delta"
+            if base is None:
+                base = metadata["base"]["path"].value
+                if self._path is not None:
+                    base = os.path.join(
+                        os.path.dirname(os.path.abspath(self._path)), base
+                    )
+            self._base = _open_construction(base, **kwargs)
+            base_entry = metadata["base"]
+            base_table = self._base.section_index_table
+            if len(base_table) != base_entry["section_count"].value or bytes(
+                base_entry["index_hash"].value
+            ) != _section_index_hash(base_table):
+                self._base.close()
+                raise AssertionError(
+                    "The base construction has changed since the delta was written"
+                )
+            self._base_section_indices = metadata["base_section_indices"].value.astype(
+                numpy.int64
             )
+            self._base_section_hashes = (
+                metadata["base_section_hashes"].value.view(numpy.uint8).reshape(-1, 20)
+            )
+        except BaseException:
+            super().close()
+            raise
+
+    @property
+    def base(self) -> Union[ConstructionReader, DeltaConstructionReader]:
+        return self._base
+
+    @property
+    def base_section_indices(self) -> numpy.ndarray:
+        """The base section index each section references or -1 if the section is stored in the delta."""
+        return self._base_section_indices.copy()
+
+    @property
+    def sections(self) -> List[Tuple[int, int, int, int, int, int, int, int]]:
+        """The section index table entries. Sections that reference the base have a position and length of 0."""
+        return super().sections
+
+    def _payload(self, section_index: int) -> Tuple[Union[bytes, memoryview], int]:
+        base_index = int(self._base_section_indices[section_index])
+        if base_index < 0:
+            return super()._payload(section_index)
+        payload, compression = self._base._payload(base_index)
+        if (
+            _payload_hash(payload, compression)
+            != self._base_section_hashes[section_index].tobytes()
+        ):
+            raise AssertionError(
+                f"Section {base_index} of the base construction has changed since the delta was written"
+            )
+        return payload, compression
+
+    def _cache_key(self, section_index: int) -> Tuple[int, int, int, int, int]:
+        base_index = int(self._base_section_indices[section_index])
+        if base_index < 0:
+            return super()._cache_key(section_index)
+        # sections referencing the base all have a position of 0 so they are keyed on a negative position
+        _, _, _, shapex, shapey, shapez, _, _ = self._section_index_table[
+            section_index
+        ].item()
+        return -1 - base_index, 0, shapex, shapey, shapez
+
+    def iter_sections(
+        self,
+        section_indices: Optional[Iterable[int]] = None,
+        batch_size: int = 2**23,
+        prefetch: bool = True,
+    ) -> Iterator[Tuple[int, ConstructionSection]]:
+        """
+        Iterate over the sections stored in the delta in file order then those read from the base.
+
+        :param section_indices: The indices of the sections to read. Defaults to all sections.
+        :param batch_size: See ConstructionReader.iter_sections.
+        :param prefetch: See ConstructionReader.iter_sections.
+        :return: An iterator of (section index, section) tuples.
+        """
+        if section_indices is None:
+            section_indices = numpy.arange(len(self._base_section_indices))
         else:
-            raise Exception(
-                f"This wrapper doesn't support any section version higher than {max_section_version}"
+            section_indices = numpy.array(list(section_indices), dtype=numpy.int64)
+        referenced = self._base_section_indices[section_indices] >= 0
+        if not referenced.all():
+            yield from super().iter_sections(
+                section_indices[~referenced], batch_size, prefetch
             )
+        for section_index in section_indices[referenced].tolist():
+            yield section_index, self.read(section_index)
 
     def close(self):
-        self._exit_write()
-        self._buffer.close()
+        super().close()
+        self._base.close()
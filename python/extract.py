@@ -0,0 +1,57 @@
+"""
+Copy the sections of a construction that intersect boxes or are at given indices into a new construction.
+The section data is copied without being decompressed unless --prune-palette is given.
+Run from the repository root:
+
+    python -m python.extract source.construction cropped.construction --box 0 0 0 64 256 64
+"""
+
+from __future__ import annotations
+
+import argparse
+from typing import List, Optional
+
+from python.construction import extract
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("source", help="The construction file to extract from.")
+    parser.add_argument("destination", help="The construction file to write.")
+    parser.add_argument(
+        "--box",
+        action="append",
+        nargs=6,
+        type=int,
+        metavar=("MIN_X", "MIN_Y", "MIN_Z", "MAX_X", "MAX_Y", "MAX_Z"),
+        help="Extract the sections intersecting this box. The max point is exclusive. May be given more than once.",
+    )
+    parser.add_argument(
+        "--index",
+        action="append",
+        type=int,
+        help="Extract the section at this index. May be given more than once.",
+    )
+    parser.add_argument(
+        "--prune-palette",
+        action="store_true",
+        help="Remove unused blocks from the palette. This decodes and compresses each section again.",
+    )
+    args = parser.parse_args(args)
+    if args.box is None and args.index is None:
+        parser.error("At least one --box or --index is required")
+
+    count = extract(
+        args.source,
+        args.destination,
+        args.box,
+        args.index,
+        args.prune_palette,
+    )
+    print(f"Extracted {count} sections to {args.destination}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Merge construction files into one construction with a combined palette.
+The section data of a source is copied without being decompressed when its palette indices are unchanged.
+Run from the repository root:
+
+    python -m python.merge merged.construction first.construction second.construction --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+from typing import List, Optional
+
+from python.construction import compression_ids, merge
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("destination", help="The construction file to write.")
+    parser.add_argument("sources", nargs="+", help="The construction files to merge.")
+    parser.add_argument(
+        "--format-version",
+        type=int,
+        default=0,
+        help="The construction format version to write.",
+    )
+    parser.add_argument(
+        "--section-version",
+        type=int,
+        default=0,
+        help="The section format version to write.",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=sorted(compression_ids),
+        default="gzip",
+        help="The codec to compress with.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Compress remapped sections on a pool of this many workers.",
+    )
+    args = parser.parse_args(args)
+
+    count = merge(
+        args.sources,
+        args.destination,
+        format_version=args.format_version,
+        section_version=args.section_version,
+        compression=args.compression,
+        workers=args.workers,
+    )
+    print(f"Merged {count} sections into {args.destination}")
+
+
+if __name__ == "__main__":
+    main()
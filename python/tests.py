@@ -1,17 +1,48 @@
 from __future__ import annotations
 
+import asyncio
+import io
 import time
 import unittest
 import glob
 import os
 from itertools import product
+from concurrent.futures import ThreadPoolExecutor
 from typing import Tuple
 
 import numpy as np
 
 from amulet.api import blockstate_to_block
+from amulet.api.entity import Entity
+from amulet.api.block_entity import BlockEntity
+import amulet_nbt
 
-from python.construction import ConstructionReader, ConstructionWriter, ConstructionSection
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+from python.construction import (
+    ConstructionReader,
+    ConstructionWriter,
+    ConstructionSection,
+    LazyConstructionSection,
+    AsyncConstructionReader,
+    AsyncConstructionWriter,
+    palette_cache,
+    Instrumentation,
+    ShardedConstructionReader,
+    build_manifest,
+    extract,
+    merge,
+    DeltaConstructionReader,
+    compression_ids,
+)
 
 REMOVE_TEST_GENERATED_FILES = True
 RUN_STRESS_TEST = False
@@ -245,12 +276,965 @@ class ConstructionTestCase(unittest.TestCase):
 
         self.assertEqual(sections, sections2)
 
+    def test_mmap(self):
+        blocks, shape = self._blocks_1()
+        sections = []
+
+        with ConstructionWriter("test_mmap.construction", TEST_EDITION, TEST_VERSION) as construction:
+            for min_pos in product(range(0, 32, 16), range(0, 32, 16), range(0, 32, 16)):
+                section_in = ConstructionSection(min_pos, shape, blocks, self.small_block_palette, [], [])
+                construction.write(section_in)
+                sections.append(section_in)
+
+        with ConstructionReader("test_mmap.construction") as construction:
+            sections2 = [construction.read(i) for i in range(len(construction.sections))]
+
+        with ConstructionReader("test_mmap.construction", use_mmap=True) as construction:
+            self.assertEqual(len(sections), len(construction.sections))
+            sections3 = [construction.read(i) for i in range(len(construction.sections))]
+
+        with open("test_mmap.construction", "rb") as f:
+            buffer = io.BytesIO(f.read())
+        with ConstructionReader(buffer, use_mmap=True) as construction:
+            sections4 = [construction.read(i) for i in range(len(construction.sections))]
+
+        self.assertEqual(sections2, sections3)
+        self.assertEqual(sections2, sections4)
+
+    def test_read_many(self):
+        blocks, shape = self._blocks_1()
+
+        with ConstructionWriter("test_read_many.construction", TEST_EDITION, TEST_VERSION) as construction:
+            for min_pos in product(range(0, 48, 16), range(0, 32, 16), range(0, 32, 16)):
+                construction.write(ConstructionSection(min_pos, shape, blocks, self.small_block_palette, [], []))
+
+        with ConstructionReader("test_read_many.construction") as construction:
+            sections = [construction.read(i) for i in range(len(construction.sections))]
+            indices = list(range(len(sections)))[::-1]
+            for use_processes in (False, True):
+                sections2 = list(construction.read_many(indices, workers=2, use_processes=use_processes))
+                self.assertEqual(indices, [i for i, _ in sections2])
+                self.assertEqual(sections[::-1], [section for _, section in sections2])
+            sections3 = dict(construction.read_many(indices, workers=3, ordered=False))
+            self.assertEqual(sections, [sections3[i] for i in range(len(sections))])
+
+    def test_thread_safe(self):
+        blocks, shape = self._blocks_1()
+
+        with ConstructionWriter("test_thread_safe.construction", TEST_EDITION, TEST_VERSION) as construction:
+            for min_pos in product(range(0, 64, 16), range(0, 32, 16), range(0, 32, 16)):
+                construction.write(ConstructionSection(min_pos, shape, blocks, self.small_block_palette, [], []))
+
+        with ConstructionReader("test_thread_safe.construction") as construction:
+            sections = [construction.read(i) for i in range(len(construction.sections))]
+
+        with open("test_thread_safe.construction", "rb") as f:
+            buffer = io.BytesIO(f.read())
+
+        for file_or_buffer in ("test_thread_safe.construction", buffer):
+            with ConstructionReader(file_or_buffer, thread_safe=True) as construction:
+                indices = list(range(len(sections))) * 4
+                with ThreadPoolExecutor(8) as executor:
+                    sections2 = list(executor.map(construction.read, indices))
+            self.assertEqual(sections * 4, sections2)
+
+    def test_spatial_queries(self):
+        blocks, shape = self._blocks_1((8, 16, 8))
+
+        with ConstructionWriter("test_spatial_queries.construction", TEST_EDITION, TEST_VERSION) as construction:
+            for min_pos in product(range(-32, 32, 8), range(0, 32, 16), range(0, 32, 8)):
+                construction.write(ConstructionSection(min_pos, shape, blocks, self.small_block_palette, [], []))
+
+        with ConstructionReader("test_spatial_queries.construction") as construction:
+            table = construction.section_index_table
+            self.assertEqual(construction.sections, table.tolist())
+
+            def brute_force(min_point, max_point):
+                return [
+                    i for i, (sx, sy, sz, shapex, shapey, shapez, _, _) in enumerate(construction.sections)
+                    if all(
+                        s < max_c and s + size > min_c
+                        for s, size, min_c, max_c in zip((sx, sy, sz), (shapex, shapey, shapez), min_point, max_point)
+                    )
+                ]
+
+            for min_point, max_point in (
+                ((0, 0, 0), (16, 16, 16)),
+                ((-20, 5, 3), (7, 17, 9)),
+                ((-100, -100, -100), (100, 100, 100)),
+                ((100, 0, 0), (116, 16, 16)),
+            ):
+                self.assertEqual(brute_force(min_point, max_point), construction.sections_in_box(min_point, max_point))
+
+            sub_chunk_sections = construction.sections_at_subchunk(-1, 1, 0)
+            self.assertEqual(4, len(sub_chunk_sections))
+            for i in sub_chunk_sections:
+                self.assertEqual((-1, 1, 0), tuple(v >> 4 for v in construction.sections[i][:3]))
+            self.assertEqual([], construction.sections_at_subchunk(5, 5, 5))
+
+    def test_lazy_read(self):
+        blocks, shape = self._blocks_1()
+        entities = [Entity("minecraft", "armor_stand", 1.5, 2.0, 3.5, amulet_nbt.NBTFile())]
+        block_entities = [BlockEntity("minecraft", "chest", 1, 2, 3, amulet_nbt.NBTFile())]
+
+        with ConstructionWriter("test_lazy_read.construction", TEST_EDITION, TEST_VERSION) as construction:
+            construction.write(ConstructionSection((0, 0, 0), shape, blocks, self.small_block_palette, entities, block_entities))
+            construction.write(ConstructionSection((16, 0, 0), shape, None, self.small_block_palette, entities, None))
+
+        with ConstructionReader("test_lazy_read.construction") as construction:
+            for i in range(2):
+                section = construction.read(i)
+                lazy_section = construction.read(i, lazy=True)
+                self.assertIsInstance(lazy_section, LazyConstructionSection)
+                self.assertEqual(section.location, lazy_section.location)
+                self.assertEqual(section.shape, lazy_section.shape)
+                self.assertTrue(np.array_equal(section.blocks, lazy_section.blocks))
+                self.assertEqual(
+                    [(e.namespaced_name, e.location) for e in section.entities],
+                    [(e.namespaced_name, e.location) for e in lazy_section.entities],
+                )
+                self.assertEqual(section.block_entities is None, lazy_section.block_entities is None)
+
+            lazy_section = construction.read(0, lazy=True)
+            lazy_section.blocks = np.zeros(shape, dtype=int)
+            self.assertFalse(lazy_section.blocks.any())
+            self.assertEqual(1, len(lazy_section.block_entities))
+
+    def test_iter_sections(self):
+        blocks, shape = self._blocks_1()
+
+        with ConstructionWriter("test_iter_sections.construction", TEST_EDITION, TEST_VERSION) as construction:
+            for min_pos in product(range(0, 64, 16), range(0, 32, 16), range(0, 32, 16)):
+                construction.write(ConstructionSection(min_pos, shape, blocks, self.small_block_palette, [], []))
+
+        with ConstructionReader("test_iter_sections.construction") as construction:
+            sections = [construction.read(i) for i in range(len(construction.sections))]
+            for batch_size in (0, 1000, 2**23):
+                for prefetch in (False, True):
+                    sections2 = list(construction.iter_sections(batch_size=batch_size, prefetch=prefetch))
+                    self.assertEqual(list(range(len(sections))), [i for i, _ in sections2])
+                    self.assertEqual(sections, [section for _, section in sections2])
+
+            sections3 = list(construction.iter_sections([5, 1, 3]))
+            self.assertEqual([1, 3, 5], [i for i, _ in sections3])
+            self.assertEqual([sections[1], sections[3], sections[5]], [section for _, section in sections3])
+
+    def test_pipelined_writer(self):
+        blocks, shape = self._blocks_1()
+        positions = list(product(range(0, 64, 16), range(0, 32, 16), range(0, 32, 16)))
+
+        with ConstructionWriter("test_pipelined_writer.construction", TEST_EDITION, TEST_VERSION) as construction:
+            for min_pos in positions:
+                construction.write(ConstructionSection(min_pos, shape, blocks, self.small_block_palette, [], []))
+
+        with ConstructionReader("test_pipelined_writer.construction") as construction:
+            sections = [construction.read(i) for i in range(len(construction.sections))]
+
+        for use_processes in (False, True):
+            with ConstructionWriter(
+                "test_pipelined_writer_2.construction", TEST_EDITION, TEST_VERSION, workers=2, use_processes=use_processes
+            ) as construction:
+                for min_pos in positions:
+                    construction.write(ConstructionSection(min_pos, shape, blocks, self.small_block_palette, [], []))
+
+            with ConstructionReader("test_pipelined_writer_2.construction") as construction:
+                self.assertEqual([tuple(section.location) for section in sections], [tuple(s[:3]) for s in construction.sections])
+                end = construction.sections[0][6]
+                for *_, position, length in construction.sections:
+                    self.assertEqual(end, position)
+                    end += length
+                sections2 = [construction.read(i) for i in range(len(construction.sections))]
+            self.assertEqual(sections, sections2)
+
+    def test_palette_remap(self):
+        shape = (16, 16, 16)
+        palette = list(self.small_block_palette)
+        blocks_1 = np.full(shape, 3)
+        blocks_1[:8] = 1
+        blocks_2 = np.full(shape, 8)
+        blocks_2[:8] = 3
+        blocks_3 = np.full(shape, 9)
+        blocks_3[:8] = 1
+
+        with ConstructionWriter("test_palette_remap.construction", TEST_EDITION, TEST_VERSION) as construction:
+            construction.write(ConstructionSection((0, 0, 0), shape, blocks_1, palette, [], []))
+            construction.write(ConstructionSection((16, 0, 0), shape, blocks_2, palette, [], []))
+            palette.append(blockstate_to_block("minecraft:gold_block"))
+            construction.write(ConstructionSection((32, 0, 0), shape, blocks_3, palette, [], []))
+            self.assertEqual([palette[1], palette[3], palette[8], palette[9]], construction.palette)
+
+            gold_block = construction.get_add_block(palette[9])
+            self.assertEqual(3, gold_block)
+            blocks_4 = np.full(shape, gold_block)
+            blocks_4[:8] = construction.get_add_block(palette[0])
+            construction.write_indexed(ConstructionSection((48, 0, 0), shape, blocks_4, [], [], []))
+            self.assertEqual(5, len(construction.palette))
+
+            # editing an entry in place invalidates the cached lookup table
+            original_palette = list(palette)
+            palette[3] = blockstate_to_block("minecraft:glass")
+            construction.write(ConstructionSection((64, 0, 0), shape, blocks_2, palette, [], []))
+
+        with ConstructionReader("test_palette_remap.construction") as construction:
+            read_palette = np.array(construction.palette + [None], dtype=object)[:-1]
+            for i, (blocks, section_palette) in enumerate(((blocks_1, original_palette), (blocks_2, original_palette), (blocks_3, original_palette), (blocks_4, None), (blocks_2, palette))):
+                if section_palette is None:
+                    self.assertTrue(np.array_equal(blocks, construction.read(i).blocks))
+                else:
+                    in_palette = np.array(section_palette + [None], dtype=object)[:-1]
+                    self.assertTrue(np.array_equal(in_palette[blocks], read_palette[construction.read(i).blocks]))
+
+    def test_write_volume(self):
+        origin = (-5, 3, 7)
+        volume = np.random.RandomState(0).randint(1, len(self.small_block_palette), (40, 20, 30))
+        volume[:, 10:] = 0
+        entities = [Entity("minecraft", "pig", -4.5, 3.0, 20.5, amulet_nbt.NBTFile()), Entity("minecraft", "cow", 30.0, 20.0, 30.0, amulet_nbt.NBTFile())]
+        block_entities = [BlockEntity("minecraft", "chest", 20, 4, 8, amulet_nbt.NBTFile())]
+
+        with ConstructionWriter("test_write_volume.construction", TEST_EDITION, TEST_VERSION) as construction:
+            construction.write_volume(origin, volume, self.small_block_palette, entities, block_entities, skip_index=0)
+
+        with ConstructionReader("test_write_volume.construction") as construction:
+            read_palette = np.array(construction.palette + [None], dtype=object)[:-1]
+            in_palette = np.array(self.small_block_palette + [None], dtype=object)[:-1]
+            volume_out = np.full(volume.shape, None, dtype=object)
+            entities_out = []
+            block_entities_out = []
+            for i in range(len(construction.sections)):
+                section = construction.read(i)
+                for point, size in zip(section.location, section.shape):
+                    self.assertLessEqual(point + size, ((point >> 4) + 1) << 4)
+                x, y, z = (p - o for p, o in zip(section.location, origin))
+                dx, dy, dz = section.shape
+                self.assertTrue((volume_out[x:x + dx, y:y + dy, z:z + dz] == None).all())
+                volume_out[x:x + dx, y:y + dy, z:z + dz] = read_palette[section.blocks]
+                entities_out += [e.base_name for e in section.entities]
+                block_entities_out += [e.base_name for e in section.block_entities]
+
+        # sections entirely made of air are skipped unless they contain an entity
+        air = volume_out == None
+        self.assertTrue(air.any())
+        self.assertTrue((volume[air] == 0).all())
+        self.assertTrue(np.array_equal(in_palette[volume[~air]], volume_out[~air]))
+        self.assertEqual(["pig", "cow"], entities_out)
+        self.assertEqual(["chest"], block_entities_out)
+
+    def test_read_volume(self):
+        origin = (-5, 3, 7)
+        palette = self.small_block_palette[:8]
+        volume = np.random.RandomState(0).randint(0, len(palette), (40, 20, 30))
+        volume[:8] = np.arange(len(palette)).reshape(-1, 1, 1)
+        selection = (origin[0], origin[1], origin[2], origin[0] + 40, origin[1] + 20, origin[2] + 30)
+
+        with ConstructionWriter("test_read_volume.construction", TEST_EDITION, TEST_VERSION, [selection]) as construction:
+            construction.write_volume(origin, volume, palette)
+
+        with ConstructionReader("test_read_volume.construction") as construction:
+            self.assertTrue(np.array_equal(volume, construction.read_volume()))
+            self.assertTrue(np.array_equal(volume[3:20, 5:6, 10:30], construction.read_volume((-2, 8, 17, 15, 9, 37))))
+
+            out = np.full((50, 20, 30), 99, dtype=np.int16)
+            construction.read_volume((-10, 3, 7, 40, 23, 37), out)
+            self.assertTrue((out[:5] == 99).all())
+            self.assertTrue((out[45:] == 99).all())
+            self.assertTrue(np.array_equal(volume, out[5:45]))
+
+    def test_palette_cache(self):
+        blocks = np.arange(16 ** 3).reshape((16, 16, 16)) % len(self.small_block_palette)
+
+        with ConstructionWriter("test_palette_cache.construction", TEST_EDITION, TEST_VERSION) as construction:
+            construction.write(ConstructionSection((0, 0, 0), (16, 16, 16), blocks, self.small_block_palette, [], []))
+
+        palette_cache.clear()
+        with ConstructionReader("test_palette_cache.construction") as construction:
+            palette = construction.palette
+        self.assertEqual(self.small_block_palette, palette[:len(self.small_block_palette)])
+        hits = palette_cache.hits
+        with ConstructionReader("test_palette_cache.construction") as construction:
+            palette2 = construction.palette
+        self.assertEqual(palette, palette2)
+        self.assertTrue(all(a is b for a, b in zip(palette, palette2)))
+        self.assertEqual(hits + len(palette) + 1, palette_cache.hits)
+
+        max_size = palette_cache.max_size
+        try:
+            palette_cache.max_size = 2
+            self.assertEqual(2, len(palette_cache))
+            with ConstructionReader("test_palette_cache.construction") as construction:
+                self.assertEqual(palette, construction.palette)
+        finally:
+            palette_cache.max_size = max_size
+
+    def test_section_cache(self):
+        blocks, shape = self._blocks_1()
+
+        with ConstructionWriter("test_section_cache.construction", TEST_EDITION, TEST_VERSION) as construction:
+            for min_pos in product(range(0, 64, 16), range(0, 16, 16), range(0, 16, 16)):
+                construction.write(ConstructionSection(min_pos, shape, blocks, self.small_block_palette, [], []))
+
+        with ConstructionReader("test_section_cache.construction") as construction:
+            sections = [construction.read(i) for i in range(len(construction.sections))]
+            self.assertIsNone(construction.cache_stats)
+
+        # enough space for two sections
+        cache_size = 2 * (sections[0].blocks.nbytes + 256)
+        with ConstructionReader("test_section_cache.construction", cache_size=cache_size) as construction:
+            self.assertEqual(sections[0], construction.read(0))
+            self.assertEqual(sections[1], construction.read(1))
+            section = construction.read(0)
+            self.assertEqual(sections[0], section)
+            self.assertFalse(section.blocks.flags.writeable)
+            # editing the returned lists does not modify the cached section
+            section.entities.append(Entity("minecraft", "pig", 0.0, 0.0, 0.0, amulet_nbt.NBTFile()))
+            section.block_entities.append(BlockEntity("minecraft", "chest", 0, 0, 0, amulet_nbt.NBTFile()))
+            self.assertEqual(sections[0], construction.read(0))
+            self.assertEqual(sections[2], construction.read(2))
+            self.assertEqual(sections[1], construction.read(1))
+            stats = construction.cache_stats
+            self.assertEqual(2, stats["hits"])
+            self.assertEqual(4, stats["misses"])
+            self.assertEqual(2, stats["evictions"])
+            self.assertEqual(2, stats["entries"])
+            self.assertLessEqual(stats["size"], stats["max_size"])
+        self.assertEqual(0, construction.cache_stats["entries"])
+
+        with ConstructionReader("test_section_cache.construction", cache_size=2 ** 20, cache_read_only=False) as construction:
+            section = construction.read(0)
+            section.blocks[:] = 0
+            section = construction.read(0)
+            self.assertTrue(section.blocks.flags.writeable)
+            self.assertEqual(sections[0], section)
+            self.assertEqual(1, construction.cache_stats["hits"])
+            # a cache hit still returns a lazy section when one is requested
+            section = construction.read(0, lazy=True)
+            self.assertIsInstance(section, LazyConstructionSection)
+            self.assertEqual(sections[0], section)
+            self.assertEqual(2, construction.cache_stats["hits"])
+
+    def test_async(self):
+        blocks, shape = self._blocks_1()
+        positions = list(product(range(0, 64, 16), range(0, 32, 16), range(0, 16, 16)))
+
+        with ConstructionWriter("test_async.construction", TEST_EDITION, TEST_VERSION) as construction:
+            for min_pos in positions:
+                construction.write(ConstructionSection(min_pos, shape, blocks, self.small_block_palette, [], []))
+
+        with ConstructionReader("test_async.construction") as construction:
+            sections = [construction.read(i) for i in range(len(construction.sections))]
+
+        # the writer may be created outside of the event loop it is used in
+        writer = AsyncConstructionWriter("test_async_2.construction", TEST_EDITION, TEST_VERSION)
+
+        async def write_and_read():
+            async with writer as construction:
+                await asyncio.gather(*(
+                    construction.write(ConstructionSection(min_pos, shape, blocks, self.small_block_palette, [], []))
+                    for min_pos in positions
+                ))
+
+            async with AsyncConstructionReader("test_async_2.construction") as construction:
+                sections2 = await asyncio.gather(*(construction.read(i) for i in range(len(construction.sections))))
+                sections3 = [section async for section in construction.iter()]
+            return sections2, sections3
+
+        sections2, sections3 = asyncio.run(write_and_read())
+        self.assertEqual(sections, sections2)
+        self.assertEqual(sections, sections3)
+
+    def test_compression(self):
+        blocks, shape = self._blocks_1()
+        compressions = ["none", "gzip", "zlib"]
+        if zstandard is not None:
+            compressions.append("zstd")
+        if lz4 is not None:
+            compressions.append("lz4")
+
+        sections = None
+        for format_version, compression, compression_level in [(0, "gzip", None)] + [
+            (1, compression, None) for compression in compressions
+        ] + [(1, "gzip", 1), (1, "zlib", 9)]:
+            with ConstructionWriter(
+                "test_compression.construction", TEST_EDITION, TEST_VERSION, format_version=format_version, section_version=0 if format_version == 0 else 2, compression=compression, compression_level=compression_level
+            ) as construction:
+                for min_pos in product(range(0, 32, 16), range(0, 32, 16), range(0, 16, 16)):
+                    construction.write(ConstructionSection(min_pos, shape, blocks, self.small_block_palette, [], []))
+
+            with ConstructionReader("test_compression.construction") as construction:
+                self.assertEqual(TEST_EDITION, construction.source_edition)
+                sections2 = [construction.read(i) for i in range(len(construction.sections))]
+            if sections is None:
+                sections = sections2
+            else:
+                self.assertEqual(sections, sections2)
+
+        with self.assertRaises(AssertionError):
+            ConstructionWriter("test_compression.construction", TEST_EDITION, TEST_VERSION, format_version=0, section_version=0, compression="zlib")
+        # format version 0 only supports section version 0
+        with self.assertRaises(AssertionError):
+            ConstructionWriter("test_compression.construction", TEST_EDITION, TEST_VERSION, format_version=0, section_version=1)
+        with ConstructionWriter("test_compression.construction", TEST_EDITION, TEST_VERSION, format_version=0) as construction:
+            construction.write(ConstructionSection((0, 0, 0), shape, np.ones(shape, dtype=int), self.small_block_palette, [], []))
+        with ConstructionReader("test_compression.construction") as construction:
+            self.assertEqual(0, construction.metadata["section_version"].value)
+            self.assertTrue((construction.read(0).blocks == 0).all())
+
+    def test_deduplicate(self):
+        blocks, shape = self._blocks_1()
+        uniform_blocks = np.ones(shape, dtype=int)
+        sections = []
+        for i, min_pos in enumerate(product(range(0, 64, 16), range(0, 32, 16), range(0, 16, 16))):
+            sections.append(ConstructionSection(min_pos, shape, blocks if i % 2 else uniform_blocks, self.small_block_palette, [], []))
+
+        for deduplicate in (False, True):
+            with ConstructionWriter(f"test_deduplicate_{deduplicate}.construction", TEST_EDITION, TEST_VERSION, deduplicate=deduplicate) as construction:
+                for section in sections:
+                    construction.write(section)
+
+        with ConstructionReader("test_deduplicate_False.construction") as construction:
+            sections_in = [construction.read(i) for i in range(len(construction.sections))]
+
+        self.assertLess(os.path.getsize("test_deduplicate_True.construction"), os.path.getsize("test_deduplicate_False.construction"))
+
+        with ConstructionReader("test_deduplicate_True.construction", cache_size=2 ** 20) as construction:
+            self.assertEqual(2, len({(position, length) for *_, position, length in construction.sections}))
+            self.assertEqual(sections_in, [construction.read(i) for i in range(len(construction.sections))])
+            self.assertEqual(len(sections) - 2, construction.cache_stats["hits"])
+            # shared payloads are at the start of the file so file order is not index order
+            iter_sections = dict(construction.iter_sections())
+            self.assertEqual(sections_in, [iter_sections[i] for i in range(len(sections))])
+            self.assertEqual(sections_in, [section for _, section in construction.read_many(range(len(sections)))])
+
+    def test_bit_packed(self):
+        palette = [blockstate_to_block(f"minecraft:wool[colour={i}]") for i in range(200)]
+        shape = (16, 16, 16)
+        random_blocks = np.random.default_rng(0).integers(0, len(palette), shape)
+        sections = [
+            ConstructionSection((0, 0, 0), shape, random_blocks, palette, [], []),
+            ConstructionSection((16, 0, 0), shape, np.zeros(shape, dtype=int), palette, [], []),
+            ConstructionSection((32, 0, 0), (3, 5, 7), random_blocks[:3, :5, :7], palette, [], []),
+            ConstructionSection((48, 0, 0), shape, None, palette, [], None),
+        ]
+
+        for section_version in (0, 1):
+            with ConstructionWriter(
+                f"test_bit_packed_{section_version}.construction", TEST_EDITION, TEST_VERSION, format_version=1, section_version=section_version, compression="none"
+            ) as construction:
+                for section in sections:
+                    construction.write(section)
+
+        self.assertLess(os.path.getsize("test_bit_packed_1.construction"), os.path.getsize("test_bit_packed_0.construction"))
+
+        with ConstructionReader("test_bit_packed_0.construction") as construction:
+            sections_0 = [construction.read(i) for i in range(len(construction.sections))]
+        with ConstructionReader("test_bit_packed_1.construction") as construction:
+            self.assertEqual(1, construction._section_version)
+            sections_1 = [construction.read(i) for i in range(len(construction.sections))]
+        self.assertEqual(sections_0, sections_1)
+        for section_in, section in zip(sections, sections_1):
+            if section_in.blocks is None:
+                self.assertIsNone(section.blocks)
+            else:
+                self.assertEqual(
+                    [section_in.palette[b] for b in section_in.blocks.ravel()],
+                    [section.palette[b] for b in section.blocks.ravel()],
+                )
+
+    def test_uniform_sections(self):
+        blocks, shape = self._blocks_1()
+        sections = [
+            ConstructionSection((0, 0, 0), shape, np.full(shape, 3), self.small_block_palette, [], []),
+            ConstructionSection((16, 0, 0), shape, blocks, self.small_block_palette, [], []),
+            ConstructionSection((32, 0, 0), (3, 5, 7), np.full((3, 5, 7), 8), self.small_block_palette, [], []),
+            ConstructionSection((48, 0, 0), (0, 16, 16), np.zeros((0, 16, 16), dtype=int), self.small_block_palette, [], []),
+        ]
+
+        for section_version in (1, 2):
+            with ConstructionWriter(
+                f"test_uniform_sections_{section_version}.construction", TEST_EDITION, TEST_VERSION, format_version=1, section_version=section_version, workers=section_version - 1
+            ) as construction:
+                for section in sections:
+                    construction.write(section)
+                construction.write_volume((64, 0, 0), np.full((32, 16, 16), 2), self.small_block_palette)
+
+        self.assertLess(os.path.getsize("test_uniform_sections_2.construction"), os.path.getsize("test_uniform_sections_1.construction"))
+
+        with ConstructionReader("test_uniform_sections_1.construction") as construction:
+            sections_1 = [construction.read(i) for i in range(len(construction.sections))]
+            volume_1 = construction.read_volume((0, 0, 0, 96, 16, 16))
+        with ConstructionReader("test_uniform_sections_2.construction") as construction:
+            sections_2 = [construction.read(i) for i in range(len(construction.sections))]
+            self.assertTrue(np.array_equal(volume_1, construction.read_volume((0, 0, 0, 96, 16, 16))))
+            self.assertTrue(np.array_equal(volume_1[8:72, 4:8], construction.read_volume((8, 4, 0, 72, 8, 16))))
+        self.assertEqual(sections_1, sections_2)
+        self.assertEqual(
+            self.small_block_palette[3], sections_2[0].palette[sections_2[0].blocks[0, 0, 0]]
+        )
+        self.assertTrue((sections_2[0].blocks == sections_2[0].blocks[0, 0, 0]).all())
+        # uniform sections are read into a full writable array
+        sections_2[0].blocks[0, 0, 0] = 0
+
+    def test_append(self):
+        blocks, shape = self._blocks_1()
+        sections = [
+            ConstructionSection(min_pos, shape, blocks, self.small_block_palette, [], [])
+            for min_pos in product(range(0, 32, 16), range(0, 32, 16), range(0, 16, 16))
+        ]
+        new_palette = [blockstate_to_block("minecraft:gold_block"), blockstate_to_block("minecraft:stone")]
+        new_blocks = np.zeros(shape, dtype=int)
+        new_blocks[:, :8] = 1
+        new_sections = [
+            ConstructionSection((32, 0, 0), shape, new_blocks, new_palette, [], []),
+            ConstructionSection((48, 0, 0), shape, None, new_palette, [], None),
+        ]
+        replacement = ConstructionSection((0, 0, 0), shape, blocks[::-1], self.small_block_palette, [], [])
+
+        with ConstructionWriter("test_append.construction", TEST_EDITION, TEST_VERSION, [(0, 0, 0, 32, 32, 16)], format_version=0, section_version=0) as construction:
+            for section in sections:
+                construction.write(section)
+        with ConstructionReader("test_append.construction") as construction:
+            original_entries = construction.sections
+            original_palette = construction.palette
+
+        construction = ConstructionWriter.append("test_append.construction")
+        for section in new_sections:
+            construction.write(section)
+        construction.replace(1, replacement)
+        construction.close()
+
+        with ConstructionReader("test_append.construction") as construction:
+            self.assertEqual(0, construction._format_version)
+            self.assertEqual(TEST_EDITION, construction.source_edition)
+            self.assertEqual([[0, 0, 0, 32, 32, 16]], construction.selection)
+            entries = construction.sections
+            self.assertEqual(len(sections) + 2, len(entries))
+            # the existing section data has not moved
+            self.assertEqual(original_entries[:1] + original_entries[2:], entries[:1] + entries[2 : len(sections)])
+            self.assertGreater(entries[1][6], original_entries[-1][6])
+            sections_out = [construction.read(i) for i in range(len(entries))]
+
+        # existing palette indices are unchanged
+        self.assertEqual(original_palette, sections_out[0].palette[: len(original_palette)])
+        for section_in, section in zip(sections[:1] + [replacement] + sections[2:] + new_sections, sections_out):
+            if section_in.blocks is None:
+                self.assertIsNone(section.blocks)
+            else:
+                self.assertEqual(
+                    [section_in.palette[b] for b in section_in.blocks.ravel()],
+                    [section.palette[b] for b in section.blocks.ravel()],
+                )
+
+    def test_append_foreign_file(self):
+        shape = (16, 16, 16)
+        anvil = blockstate_to_block("minecraft:damaged_anvil[facing=south]")
+        stone_anvil = blockstate_to_block("minecraft:stone") + anvil
+        dirt = blockstate_to_block("minecraft:dirt")
+        gold = blockstate_to_block("minecraft:gold_block")
+
+        def block_entry(name: str, extra_blocks):
+            return amulet_nbt.TAG_Compound({
+                "namespace": amulet_nbt.TAG_String("minecraft"),
+                "blockname": amulet_nbt.TAG_String(name),
+                "properties": amulet_nbt.TAG_Compound(dict(anvil.properties) if name == "damaged_anvil" else {}),
+                "extra_blocks": amulet_nbt.TAG_List([amulet_nbt.TAG_Int(i) for i in extra_blocks]),
+            })
+
+        # another writer may put the extra blocks first and compress the metadata with a different codec
+        construction = ConstructionWriter("test_append_foreign_file.construction", TEST_EDITION, TEST_VERSION, format_version=2)
+        for block in (anvil, stone_anvil, dirt):
+            construction.get_add_block(block)
+        construction._pack_palette = lambda: amulet_nbt.TAG_List([block_entry("damaged_anvil", []), block_entry("stone", [0]), block_entry("dirt", [])])
+        construction._compression = compression_ids["zlib"]
+        construction.write_indexed(ConstructionSection((0, 0, 0), shape, np.full(shape, 1), [], [], []))
+        construction.write_indexed(ConstructionSection((16, 0, 0), shape, np.full(shape, 2), [], [], []))
+        construction.close()
+
+        with ConstructionWriter.append("test_append_foreign_file.construction") as construction:
+            construction.write(ConstructionSection((32, 0, 0), shape, np.zeros(shape, dtype=int), [gold], [], []))
+
+        with ConstructionReader("test_append_foreign_file.construction") as construction:
+            self.assertEqual([stone_anvil, dirt, gold], [construction.read(i).palette[construction.read(i).blocks[0, 0, 0]] for i in range(3)])
+
+    def test_duplicate_palette(self):
+        shape = (16, 16, 16)
+        water = blockstate_to_block("minecraft:water[level=0]")
+        stone_water = blockstate_to_block("minecraft:stone") + water
+        dirt = blockstate_to_block("minecraft:dirt")
+        gold = blockstate_to_block("minecraft:gold_block")
+
+        def block_entry(name: str, properties, extra_blocks):
+            return amulet_nbt.TAG_Compound({
+                "namespace": amulet_nbt.TAG_String("minecraft"),
+                "blockname": amulet_nbt.TAG_String(name),
+                "properties": amulet_nbt.TAG_Compound(properties),
+                "extra_blocks": amulet_nbt.TAG_List([amulet_nbt.TAG_Int(i) for i in extra_blocks]),
+            })
+
+        # older writers always added the extra blocks to the palette so a block could be stored twice
+        construction = ConstructionWriter("test_duplicate_palette.construction", TEST_EDITION, TEST_VERSION)
+        for block in (stone_water, water, dirt, gold):
+            construction.get_add_block(block)
+        construction._pack_palette = lambda: amulet_nbt.TAG_List([
+            block_entry("stone", {}, [1]),
+            block_entry("water", dict(water.properties), []),
+            block_entry("water", dict(water.properties), []),
+            block_entry("dirt", {}, []),
+        ])
+        for x, block_index in zip(range(0, 48, 16), (0, 2, 3)):
+            construction.write_indexed(ConstructionSection((x, 0, 0), shape, np.full(shape, block_index), [], [], []))
+        construction.close()
+        expected = [stone_water, water, dirt]
+
+        def read_blocks(path: str, reader=ConstructionReader):
+            with reader(path) as construction:
+                return [construction.read(i).palette[construction.read(i).blocks[0, 0, 0]] for i in range(len(construction.sections))]
+
+        self.assertEqual(expected, read_blocks("test_duplicate_palette.construction"))
+
+        self.assertEqual(3, extract("test_duplicate_palette.construction", "test_duplicate_palette_extract.construction", section_indices=[0, 1, 2]))
+        self.assertEqual(expected, read_blocks("test_duplicate_palette_extract.construction"))
+
+        with ConstructionWriter(
+            "test_duplicate_palette_delta.construction", TEST_EDITION, TEST_VERSION, base="test_duplicate_palette.construction"
+        ) as construction:
+            for x, block in zip(range(0, 48, 16), expected):
+                construction.write(ConstructionSection((x, 0, 0), shape, np.zeros(shape, dtype=int), [block], [], []))
+        with DeltaConstructionReader("test_duplicate_palette_delta.construction") as construction:
+            # sections whose block indices changed can't reference the base
+            self.assertEqual([0, -1, -1], construction.base_section_indices.tolist())
+        self.assertEqual(expected, read_blocks("test_duplicate_palette_delta.construction", DeltaConstructionReader))
+
+        with ConstructionWriter.append("test_duplicate_palette.construction") as construction:
+            construction.write(ConstructionSection((48, 0, 0), shape, np.zeros(shape, dtype=int), [gold], [], []))
+        self.assertEqual(expected + [gold], read_blocks("test_duplicate_palette.construction"))
+
+    def test_instrumentation(self):
+        blocks, shape = self._blocks_1()
+        entities = [Entity("minecraft", "pig", 1.5, 2.0, 3.5, amulet_nbt.NBTFile())]
+        block_entities = [BlockEntity("minecraft", "chest", 1, 2, 3, amulet_nbt.NBTFile())]
+        calls = []
+        for workers in (0, 2):
+            instrumentation = Instrumentation(lambda name, seconds, nbytes: calls.append(name))
+            with ConstructionWriter("test_instrumentation.construction", TEST_EDITION, TEST_VERSION, format_version=1, workers=workers, instrumentation=instrumentation) as construction:
+                construction.write(ConstructionSection((0, 0, 0), shape, blocks, self.small_block_palette, entities, block_entities))
+                construction.write(ConstructionSection((16, 0, 0), shape, None, self.small_block_palette, entities, None))
+            stats = instrumentation.stats
+            self.assertEqual({"sections": 2, "blocks": blocks.size, "entities": 2, "block_entities": 1}, stats["counters"])
+            self.assertEqual(
+                {"io", "compress", "nbt_serialise", "palette_pack", "remap", "blocks", "entities"},
+                set(stats["phases"]),
+            )
+            # two sections, the metadata and the metadata offset
+            self.assertEqual(4, stats["phases"]["io"]["calls"])
+            self.assertEqual(os.path.getsize("test_instrumentation.construction") - 10, stats["phases"]["io"]["bytes"])
+            self.assertEqual(3, stats["phases"]["compress"]["calls"])
+
+        instrumentation.reset()
+        calls.clear()
+        self.assertEqual({"phases": {}, "counters": {}}, instrumentation.stats)
+        with ConstructionReader("test_instrumentation.construction", instrumentation=instrumentation) as construction:
+            construction.read(0)
+            construction.read(1)
+        stats = instrumentation.stats
+        self.assertEqual({"sections": 2, "blocks": blocks.size, "entities": 2, "block_entities": 1}, stats["counters"])
+        self.assertEqual(
+            {"io", "decompress", "nbt_parse", "palette_unpack", "blocks", "entities"},
+            set(stats["phases"]),
+        )
+        self.assertEqual(3, stats["phases"]["decompress"]["calls"])
+        self.assertEqual(len(calls), sum(phase["calls"] for phase in stats["phases"].values()))
+
+    def test_format_version_2(self):
+        blocks, shape = self._blocks_1()
+        sections = [
+            ConstructionSection(min_pos, shape, blocks, self.small_block_palette, [], [])
+            for min_pos in product(range(32, -32, -16), range(0, 32, 16), range(0, 32, 16))
+        ]
+        for format_version in (1, 2):
+            with ConstructionWriter(f"test_format_version_2_{format_version}.construction", TEST_EDITION, TEST_VERSION, [(-16, 0, 0, 48, 32, 32)], format_version=format_version) as construction:
+                for section in sections:
+                    construction.write(section)
+
+        with ConstructionReader("test_format_version_2_1.construction") as construction:
+            sections_1 = [construction.read(i) for i in range(len(construction.sections))]
+            entries_1 = construction.sections
+            table_1 = construction.section_index_table
+
+        for use_mmap in (False, True):
+            instrumentation = Instrumentation()
+            with ConstructionReader("test_format_version_2_2.construction", use_mmap=use_mmap, instrumentation=instrumentation) as construction:
+                # opening only reads the footer and the uncompressed tables
+                self.assertEqual({"io"}, set(instrumentation.stats["phases"]))
+                self.assertEqual(entries_1, construction.sections)
+                self.assertTrue(np.array_equal(table_1, construction.section_index_table))
+                self.assertEqual(table_1.dtype, construction.section_index_table.dtype)
+                self.assertEqual([14], construction.sections_at_subchunk(-1, 1, 0))
+                self.assertEqual([0, 1, 2, 3], construction.sections_in_box((32, 0, 0), (48, 32, 32)))
+                self.assertIsNone(construction._metadata)
+                self.assertEqual(sections_1, [construction.read(i) for i in range(len(construction.sections))])
+                self.assertIsNone(construction._metadata)
+                self.assertEqual(TEST_EDITION, construction.source_edition)
+                self.assertEqual(TEST_VERSION, construction.source_version)
+                self.assertEqual([[-16, 0, 0, 48, 32, 32]], construction.selection)
+
+        construction = ConstructionWriter.append("test_format_version_2_2.construction")
+        construction.write(ConstructionSection((64, 0, 0), shape, blocks, self.small_block_palette, [], []))
+        construction.close()
+        with ConstructionReader("test_format_version_2_2.construction") as construction:
+            self.assertEqual(entries_1, construction.sections[: len(sections)])
+            self.assertEqual(len(sections) + 1, len(construction.sections))
+            self.assertEqual(construction.read(0).blocks.tolist(), construction.read(len(sections)).blocks.tolist())
+            self.assertEqual(TEST_EDITION, construction.source_edition)
+
+    def test_sharded(self):
+        blocks, shape = self._blocks_1()
+        palettes = [
+            self.small_block_palette,
+            self.small_block_palette[::-1],
+            [blockstate_to_block(f"minecraft:wool[colour={i}]") for i in range(9)],
+        ]
+        sections = []
+        shard_paths = []
+
+        def write_shard(shard_index: int):
+            with ConstructionWriter(
+                f"test_sharded_{shard_index}.construction", TEST_EDITION, TEST_VERSION, [(shard_index * 32, 0, 0, shard_index * 32 + 32, 16, 16)]
+            ) as construction:
+                for x in range(shard_index * 32, shard_index * 32 + 32, 16):
+                    construction.write(ConstructionSection((x, 0, 0), shape, blocks, palettes[shard_index], [], []))
+
+        # each shard has its own writer so they can be written in parallel
+        with ThreadPoolExecutor(3) as executor:
+            list(executor.map(write_shard, range(3)))
+        for shard_index in range(3):
+            shard_paths.append(f"test_sharded_{shard_index}.construction")
+            for _ in range(2):
+                sections.append([palettes[shard_index][b] for b in blocks.ravel()])
+
+        build_manifest("test_sharded.construction", shard_paths)
+        with ShardedConstructionReader("test_sharded.construction", use_mmap=True) as construction:
+            self.assertEqual(3, construction.shard_count)
+            self.assertEqual(6, len(construction.sections))
+            self.assertEqual(TEST_EDITION, construction.source_edition)
+            self.assertEqual(TEST_VERSION, construction.source_version)
+            self.assertEqual([[shard_index * 32, 0, 0, shard_index * 32 + 32, 16, 16] for shard_index in range(3)], construction.selection)
+            self.assertEqual((1, 1), construction.locate(3))
+            # the spatial queries use the manifest so no shard is opened
+            self.assertEqual([2, 3, 4], construction.sections_in_box((40, 0, 0), (72, 16, 16)))
+            self.assertEqual([3], construction.sections_at_subchunk(3, 0, 0))
+            self.assertEqual([None] * 3, construction._shards)
+            volume = construction.read_volume((40, 0, 0, 72, 16, 16))
+            self.assertIsNone(construction._shards[0])
+            expected_volume = np.concatenate([np.array(sections[section_index], dtype=object).reshape(shape) for section_index in (2, 3, 4)])[8:40]
+            self.assertEqual(expected_volume.ravel().tolist(), [construction.palette[b] for b in volume.ravel()])
+            for section_index in range(6):
+                section = construction.read(section_index)
+                self.assertEqual(section_index * 16, section.location[0])
+                self.assertEqual(sections[section_index], [section.palette[b] for b in section.blocks.ravel()])
+            self.assertEqual(
+                list(range(6)), [section_index for section_index, _ in construction.iter_sections()]
+            )
+            iter_sections = dict(construction.iter_sections([5, 0, 2]))
+            self.assertEqual([0, 2, 5], sorted(iter_sections))
+            self.assertEqual(sections[5], [iter_sections[5].palette[b] for b in iter_sections[5].blocks.ravel()])
+            self.assertEqual(TEST_EDITION, construction.metadata["export_version"]["edition"].value)
+            section = construction.read(2, lazy=True)
+            self.assertIsInstance(section, LazyConstructionSection)
+            self.assertEqual(sections[2], [section.palette[b] for b in section.blocks.ravel()])
+            read_many = list(construction.read_many([4, 1, 0, 5], workers=2))
+            self.assertEqual([4, 1, 0, 5], [section_index for section_index, _ in read_many])
+            for section_index, section in read_many:
+                self.assertEqual(sections[section_index], [section.palette[b] for b in section.blocks.ravel()])
+            self.assertEqual([0, 1, 4, 5], sorted(section_index for section_index, _ in construction.read_many([4, 1, 0, 5], workers=2, ordered=False)))
+            self.assertIsNone(construction.cache_stats)
+
+        with ShardedConstructionReader("test_sharded.construction", cache_size=2 ** 20) as construction:
+            construction.read(0)
+            construction.read(0)
+            construction.read(5)
+            stats = construction.cache_stats
+            self.assertEqual(1, stats["hits"])
+            self.assertEqual(2, stats["misses"])
+            self.assertEqual(2 * 2 ** 20, stats["max_size"])
+
+        # shards outside the manifest directory are stored with absolute paths
+        os.makedirs("test_sharded_manifest", exist_ok=True)
+        self.addCleanup(os.rmdir, "test_sharded_manifest")
+        self.addCleanup(os.remove, os.path.join("test_sharded_manifest", "test_sharded.construction"))
+        build_manifest(os.path.join("test_sharded_manifest", "test_sharded.construction"), shard_paths)
+        with ShardedConstructionReader(os.path.join("test_sharded_manifest", "test_sharded.construction")) as construction:
+            self.assertEqual(os.path.abspath(shard_paths[0]), construction.metadata["shards"][0]["path"].value)
+            self.assertEqual(sections[5], [construction.read(5).palette[b] for b in construction.read(5).blocks.ravel()])
+
+        # a shard appended to after the manifest was built is rejected when it is opened
+        with ConstructionWriter.append(shard_paths[1]) as construction:
+            construction.write(ConstructionSection((80, 0, 0), shape, blocks, [blockstate_to_block("minecraft:glass")] * 9, [], []))
+        with ShardedConstructionReader("test_sharded.construction") as construction:
+            construction.read(0)
+            with self.assertRaises(AssertionError):
+                construction.read(2)
+
+    def test_extract(self):
+        blocks, shape = self._blocks_1()
+        with ConstructionWriter("test_extract.construction", TEST_EDITION, TEST_VERSION, [(0, 0, 0, 64, 32, 16)], deduplicate=True) as construction:
+            for min_pos in product(range(0, 64, 16), range(0, 32, 16), range(0, 16, 16)):
+                # only the sections with an x of 48 use the anvil
+                construction.write(ConstructionSection(min_pos, shape, np.minimum(blocks, 7 + (min_pos[0] == 48)), self.small_block_palette, [], []))
+
+        with open("test_extract.construction", "rb") as f:
+            data = f.read()
+        with ConstructionReader("test_extract.construction") as construction:
+            source_entries = construction.sections
+            source_sections = [construction.read(i) for i in range(len(source_entries))]
+            source_palette = construction.palette
+
+        self.assertEqual(3, extract("test_extract.construction", "test_extract_box.construction", [(20, 0, 0, 40, 16, 16), (0, 16, 0, 1, 17, 1)]))
+        with ConstructionReader("test_extract_box.construction") as construction:
+            self.assertEqual([(20, 0, 0, 40, 16, 16), (0, 16, 0, 1, 17, 1)], [tuple(box) for box in construction.selection])
+            self.assertEqual(source_palette, construction.palette)
+            entries = construction.sections
+            self.assertEqual([source_entries[i][:6] for i in (1, 2, 4)], [entry[:6] for entry in entries])
+            # the sections share data in the source so they share it here
+            self.assertEqual(1, len({entry[6] for entry in entries}))
+            with open("test_extract_box.construction", "rb") as f:
+                extracted_data = f.read()
+            for section_index, source_index in enumerate((1, 2, 4)):
+                *_, position, length = entries[section_index]
+                *_, source_position, source_length = source_entries[source_index]
+                self.assertEqual(data[source_position : source_position + source_length], extracted_data[position : position + length])
+                self.assertEqual(source_sections[source_index], construction.read(section_index))
+
+        self.assertEqual(2, extract("test_extract.construction", "test_extract_pruned.construction", section_indices=[0, 3], prune_palette=True))
+        with ConstructionReader("test_extract_pruned.construction") as construction:
+            self.assertEqual(2, len(construction.sections))
+            for section_index, source_index in enumerate((0, 3)):
+                section = construction.read(section_index)
+                source_section = source_sections[source_index]
+                self.assertEqual(
+                    [source_section.palette[b] for b in source_section.blocks.ravel()],
+                    [section.palette[b] for b in section.blocks.ravel()],
+                )
+            self.assertLess(len(construction.palette), len(source_palette))
+
+    def test_merge(self):
+        blocks, shape = self._blocks_1()
+        sources = [
+            # the same palette as the first source so the section data is copied
+            ("test_merge_0.construction", range(0, 32, 16), self.small_block_palette, blocks),
+            ("test_merge_1.construction", range(32, 64, 16), self.small_block_palette, blocks),
+            # a different palette so the sections are remapped
+            ("test_merge_2.construction", range(64, 80, 16), self.small_block_palette[5:] + [blockstate_to_block("minecraft:glass")], np.minimum(blocks, 4)),
+        ]
+        source_sections = []
+        for path, xs, palette, source_blocks in sources:
+            with ConstructionWriter(path, TEST_EDITION, TEST_VERSION, [(xs[0], 0, 0, xs[-1] + 16, 16, 16)]) as construction:
+                for x in xs:
+                    section = ConstructionSection((x, 0, 0), shape, source_blocks, palette, [], [])
+                    construction.write(section)
+                    source_sections.append(section)
+
+        instrumentation = Instrumentation()
+        self.assertEqual(5, merge([path for path, *_ in sources], "test_merge.construction", workers=2, instrumentation=instrumentation))
+        # only the section of the last source was compressed again
+        self.assertEqual(1, instrumentation.stats["counters"]["sections"])
+        with open("test_merge.construction", "rb") as f:
+            data = f.read()
+        with ConstructionReader("test_merge.construction") as construction:
+            self.assertEqual([(0, 0, 0, 32, 16, 16), (32, 0, 0, 64, 16, 16), (64, 0, 0, 80, 16, 16)], [tuple(box) for box in construction.selection])
+            entries = construction.sections
+            self.assertEqual(5, len(entries))
+            for section_index, source_section in enumerate(source_sections):
+                section = construction.read(section_index)
+                self.assertEqual(source_section.location, section.location)
+                self.assertEqual(
+                    [source_section.palette[b] for b in source_section.blocks.ravel()],
+                    [section.palette[b] for b in section.blocks.ravel()],
+                )
+            with ConstructionReader("test_merge_1.construction") as source:
+                with open("test_merge_1.construction", "rb") as f:
+                    source_data = f.read()
+                for section_index, (*_, source_position, source_length) in enumerate(source.sections, 2):
+                    *_, position, length = entries[section_index]
+                    self.assertEqual(source_data[source_position : source_position + source_length], data[position : position + length])
+
+    def test_delta(self):
+        blocks, shape = self._blocks_1()
+
+        def write(path: str, changed_x: Tuple[int, ...], **kwargs):
+            with ConstructionWriter(path, TEST_EDITION, TEST_VERSION, [(0, 0, 0, 64, 16, 16)], **kwargs) as construction:
+                for x in range(0, 64, 16):
+                    construction.write(ConstructionSection((x, 0, 0), shape, np.minimum(blocks, 3) if x in changed_x else blocks, self.small_block_palette, [], []))
+
+        def assert_blocks(construction, changed_x: Tuple[int, ...]):
+            sections = [construction.read(i) for i in range(len(construction.sections))]
+            self.assertEqual(sections, [section for _, section in sorted(construction.iter_sections(), key=lambda item: item[0])])
+            for section in sections:
+                expected = np.minimum(blocks, 3) if section.location[0] in changed_x else blocks
+                self.assertEqual(
+                    [self.small_block_palette[b] for b in expected.ravel()],
+                    [section.palette[b] for b in section.blocks.ravel()],
+                )
+
+        write("test_delta_base.construction", ())
+        # sections compressed with a different codec still match once decompressed
+        write("test_delta_1.construction", (48,), format_version=1, compression="zlib", base="test_delta_base.construction")
+        write("test_delta_2.construction", (0, 48), base="test_delta_1.construction")
+
+        with DeltaConstructionReader("test_delta_1.construction") as construction:
+            self.assertEqual([0, 1, 2, -1], construction.base_section_indices.tolist())
+            self.assertEqual([0, 0, 0], [entry[7] for entry in construction.sections[:3]])
+            assert_blocks(construction, (48,))
+
+        # a delta of a delta reads through both bases
+        with DeltaConstructionReader("test_delta_2.construction") as construction:
+            self.assertEqual([-1, 1, 2, 3], construction.base_section_indices.tolist())
+            self.assertIsInstance(construction.base, DeltaConstructionReader)
+            assert_blocks(construction, (0, 48))
+
+        with DeltaConstructionReader("test_delta_2.construction", use_mmap=True) as construction:
+            self.assertIn("base", construction.metadata)
+            self.assertEqual([1], construction.sections_at_subchunk(1, 0, 0))
+            self.assertEqual([3, 1, 0], [section_index for section_index, _ in construction.read_many([3, 1, 0], workers=2)])
+            section = construction.read(1, lazy=True)
+            self.assertIsInstance(section, LazyConstructionSection)
+            self.assertEqual(construction.read(1), section)
+            volume = construction.read_volume()
+            for section_index in range(4):
+                self.assertTrue(np.array_equal(construction.read(section_index).blocks, volume[section_index * 16 : section_index * 16 + 16]))
+
+        # the sections read from the base are a clear error without the base
+        with ConstructionReader("test_delta_2.construction") as construction:
+            with self.assertRaisesRegex(Exception, "DeltaConstructionReader"):
+                construction.read(1)
+
+        # extracting or merging a delta copies the sections from its base
+        self.assertEqual(2, extract("test_delta_2.construction", "test_delta_extract.construction", section_indices=[0, 1]))
+        self.assertEqual(4, merge(["test_delta_2.construction"], "test_delta_merge.construction"))
+        for path in ("test_delta_extract.construction", "test_delta_merge.construction"):
+            with ConstructionReader(path) as construction:
+                self.assertNotIn("base", construction.metadata)
+                assert_blocks(construction, (0, 48))
+
+        write("test_delta_base.construction", (16,))
+        with self.assertRaises(AssertionError):
+            DeltaConstructionReader("test_delta_1.construction")
+
+        # a base section rewritten with data of the same size is detected when it is read
+        swapped_blocks = np.where(blocks == 1, 2, np.where(blocks == 2, 1, blocks))
+        for path, base_blocks in (("test_delta_base.construction", blocks), ("test_delta_3.construction", blocks), ("test_delta_base.construction", swapped_blocks)):
+            with ConstructionWriter(path, TEST_EDITION, TEST_VERSION, format_version=1, section_version=1, compression="none", base="test_delta_base.construction" if path == "test_delta_3.construction" else None) as construction:
+                construction.write(ConstructionSection((0, 0, 0), shape, base_blocks, self.small_block_palette, [], []))
+        with DeltaConstructionReader("test_delta_3.construction") as construction:
+            self.assertEqual([0], construction.base_section_indices.tolist())
+            with self.assertRaises(AssertionError):
+                construction.read(0)
+
     def test_empty(self):
         with ConstructionWriter("test_empty.construction", TEST_EDITION, TEST_VERSION) as construction:
             pass
 
         with ConstructionReader("test_empty.construction") as construction:
             self.assertEqual(0, len(construction.sections))
+            self.assertEqual([], construction.sections_in_box((0, 0, 0), (16, 16, 16)))
 
     def test_section_no_blocks(self):
         with ConstructionWriter("test_section_no_blocks.construction", TEST_EDITION, TEST_VERSION) as construction: